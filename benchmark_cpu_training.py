@@ -0,0 +1,130 @@
+"""
+Benchmark of SAC training on CPU: updates/sec for every combination of core pinning
+(model.torch_cores / model.solver_cores), intra-op thread count and graph convolution layer
+(model.gnn_layer), and environment steps/sec (rebalancing LP + step, run on the solver cores)
+for every core pinning.
+
+The replay buffer is filled with real macro transitions (random Dirichlet actions), every
+configuration starts from the same weights. Pinning has to happen before PyTorch starts its
+thread pools, so every pinning configuration runs in its own process.
+
+--pinning lists the configurations as "<torch_cores>/<solver_cores>" separated by ";", cores as
+comma separated ids or ranges, "none" for no pinning. The default compares no pinning with the
+learner on the first three quarters of the available cores and the solvers on the rest (no
+pinning only on a single core).
+
+Usage:
+    python benchmark_cpu_training.py --city nyc_brooklyn --threads 1,4 --updates 50
+    python benchmark_cpu_training.py --pinning "none;0-3/4-5;0-5/0-5"
+"""
+import argparse
+import copy
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import torch
+from hydra import initialize, compose
+from train import setup_macro
+from src.algos.sac import SAC
+from src.misc.cpu_perf import configure_cpu
+
+
+def parse_cores(spec):
+    # "0-3,6" -> [0, 1, 2, 3, 6], "" -> None
+    cores = []
+    for part in filter(None, spec.split(",")):
+        first, _, last = part.partition("-")
+        cores += range(int(first), int(last or first) + 1)
+    return cores or None
+
+
+def default_pinning():
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    if len(cores) < 2:
+        return "none"
+    k = max(1, len(cores) // 4)
+    return f"none;{','.join(map(str, cores[:-k]))}/{','.join(map(str, cores[-k:]))}"
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--city", default="nyc_brooklyn")
+parser.add_argument("--threads", default=None, help="comma separated intra-op thread counts (default: 1 and one per learner core)")
+parser.add_argument("--interop_threads", type=int, default=None)
+parser.add_argument("--pinning", default=default_pinning(), help='";" separated "<torch_cores>/<solver_cores>" or "none"')
+parser.add_argument("--updates", type=int, default=50, help="timed updates per configuration")
+parser.add_argument("--batch_size", type=int, default=100)
+parser.add_argument("--hidden_size", type=int, default=256)
+args = parser.parse_args()
+
+pinnings = [p.strip() for p in args.pinning.split(";") if p.strip()]
+if len(pinnings) > 1:
+    for pinning in pinnings:
+        cmd = [sys.executable, os.path.abspath(__file__), "--city", args.city, "--pinning", pinning,
+               "--updates", str(args.updates), "--batch_size", str(args.batch_size), "--hidden_size", str(args.hidden_size)]
+        if args.threads is not None:
+            cmd += ["--threads", args.threads]
+        if args.interop_threads is not None:
+            cmd += ["--interop_threads", str(args.interop_threads)]
+        subprocess.run(cmd, check=True)
+    sys.exit(0)
+
+pinning = pinnings[0]
+torch_cores, solver_cores = (None, None) if pinning == "none" else map(parse_cores, (pinning.split("/") + [""])[:2])
+configure_cpu(interop_threads=args.interop_threads, torch_cores=torch_cores, solver_cores=solver_cores)
+if args.threads is None:
+    args.threads = f"1,{len(torch_cores) if torch_cores else os.cpu_count()}"
+with initialize(version_base=None, config_path="src/config"):
+    cfg = compose(config_name="config", overrides=[
+        "simulator=macro", f"simulator.city={args.city}", "model=sac", "model.cplexpath=None",
+        "simulator.matching_solver=greedy", "simulator.reb_solver=highs", "simulator.directory=benchmark",
+        f"model.hidden_size={args.hidden_size}", f"model.batch_size={args.batch_size}",
+    ])
+env, obs_parser = setup_macro(cfg)
+obs, _ = env.reset()
+cfg.model.input_size = obs_parser.parse_obs(obs).x.shape[1]
+
+models = {}
+for gnn_layer in ("sparse", "dense"):
+    cfg.model.gnn_layer = gnn_layer
+    torch.manual_seed(cfg.simulator.seed)
+    models[gnn_layer] = SAC(env=env, input_size=cfg.model.input_size, cfg=cfg.model, parser=obs_parser, device=torch.device("cpu"))
+    models[gnn_layer].wandb = None
+models["dense"].load_state_dict(models["sparse"].state_dict())
+
+# real transitions, shared by both models
+# (env_step runs the rebalancing LP and the environment step on the solver cores)
+rng = np.random.RandomState(cfg.simulator.seed)
+model = models["sparse"]
+env_time = 0.0
+while model.replay_buffer.size() < 4 * args.batch_size:
+    obs, _ = env.reset()
+    obs = obs_parser.parse_obs(obs)
+    done = False
+    while not done:
+        action_rl = rng.dirichlet(np.ones(env.nregion))
+        start = time.perf_counter()
+        _, _, new_obs, rew, done, _ = model.env_step(action_rl)
+        env_time += time.perf_counter() - start
+        model.replay_buffer.store(obs, action_rl, cfg.model.rew_scale * rew, new_obs)
+        obs = new_obs
+models["dense"].replay_buffer = model.replay_buffer
+init_state = {name: copy.deepcopy(m.state_dict()) for name, m in models.items()}
+
+print(f"{args.city}: {env.nregion} regions, batch {args.batch_size}, hidden {args.hidden_size}, "
+      f"{torch.get_num_interop_threads()} inter-op threads")
+print(f"pinning {pinning}: {model.replay_buffer.size() / env_time:.1f} env steps/s")
+print(f"{'pinning':>12} {'threads':>8} {'gnn_layer':>10} {'updates/s':>10}")
+for threads in dict.fromkeys(int(t) for t in args.threads.split(",")):
+    torch.set_num_threads(threads)
+    for gnn_layer, model in models.items():
+        model.load_state_dict(init_state[gnn_layer])
+        for data in model.replay_buffer.sample_batches(3, args.batch_size):  # warm-up
+            model.update(data=data)
+        batches = model.replay_buffer.sample_batches(args.updates, args.batch_size)
+        start = time.perf_counter()
+        for data in batches:
+            model.update(data=data)
+        rate = args.updates / (time.perf_counter() - start)
+        print(f"{pinning:>12} {threads:>8} {gnn_layer:>10} {rate:>10.1f}")
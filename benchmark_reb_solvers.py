@@ -0,0 +1,69 @@
+"""
+Benchmark of the rebalancing solvers (CPLEX, PuLP/CBC, HiGHS, min-cost flow) on the macro environment.
+
+Every solver gets the same instances (vehicle distribution of a running episode + random desired
+distribution); the script reports the mean solve time per call and checks that all objectives agree.
+
+Usage:
+    python benchmark_reb_solvers.py --city nyc_brooklyn --episodes 2
+    python benchmark_reb_solvers.py --cplexpath /opt/opl/bin/x86-64_linux/   # also benchmark CPLEX
+"""
+import argparse
+import time
+import numpy as np
+from hydra import initialize, compose
+from train import setup_macro
+from src.algos.reb_flow_solver import solveRebFlow, solveRebFlow_pulp, solveRebFlow_highs, solveRebFlow_network
+from src.misc.utils import dictsum
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--city", default="nyc_brooklyn")
+parser.add_argument("--episodes", type=int, default=2)
+parser.add_argument("--shortage_penalty", type=float, default=3.0)
+parser.add_argument("--cplexpath", default="None", help="CPLEX installation directory (skipped if None)")
+args = parser.parse_args()
+
+with initialize(version_base=None, config_path="src/config"):
+    cfg = compose(config_name="config", overrides=[
+        "simulator=macro", f"simulator.city={args.city}", f"model.cplexpath={args.cplexpath}",
+        f"simulator.shortage_penalty={args.shortage_penalty}",
+        "simulator.matching_solver=greedy", "simulator.directory=benchmark",
+    ])
+env, _ = setup_macro(cfg)
+
+solvers = {
+    "pulp": lambda desiredAcc: solveRebFlow_pulp(env, desiredAcc, return_info=True),
+    "highs": lambda desiredAcc: solveRebFlow_highs(env, desiredAcc, return_info=True),
+    "network": lambda desiredAcc: solveRebFlow_network(env, desiredAcc, return_info=True),
+}
+if args.cplexpath != "None":
+    solvers["cplex"] = lambda desiredAcc: solveRebFlow(env, "benchmark", desiredAcc, args.cplexpath, return_info=True)
+
+times = {name: [] for name in solvers}
+max_gap = {name: 0.0 for name in solvers}
+rng = np.random.RandomState(cfg.simulator.seed)
+for episode in range(args.episodes):
+    np.random.seed(cfg.simulator.seed + episode)
+    env.reset()
+    done = False
+    while not done:
+        action_rl = rng.dirichlet(np.ones(env.nregion))
+        total = dictsum(env.acc, env.time + 1)
+        desiredAcc = {env.region[i]: int(action_rl[i] * total) for i in range(env.nregion)}
+        objectives = {}
+        for name, solve in solvers.items():
+            start = time.perf_counter()
+            action, info = solve(desiredAcc)
+            times[name].append(time.perf_counter() - start)
+            objectives[name] = info["objective"]
+            if name == "pulp":
+                reb_action = action
+        for name in solvers:
+            max_gap[name] = max(max_gap[name], abs(objectives[name] - objectives["pulp"]))
+        _, _, done, _ = env.step(reb_action)
+
+print(f"{args.city}: {env.nregion} regions, {len(env.G.edges)} edges, {len(times['pulp'])} solves")
+print(f"{'solver':<10} {'ms/solve':>10} {'speedup':>10} {'max |obj - pulp|':>18}")
+for name in solvers:
+    ms = 1000 * np.mean(times[name])
+    print(f"{name:<10} {ms:>10.2f} {np.mean(times['pulp']) / np.mean(times[name]):>10.1f} {max_gap[name]:>18.2e}")
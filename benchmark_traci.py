@@ -0,0 +1,91 @@
+"""
+Benchmark of TraCI round-trips in the SUMO environment, with and without subscriptions
+(simulator.traci_subscriptions), and of the in-process libsumo backend (simulator.sumo_backend).
+
+Every mode runs the same episode prefix (same seed, no rebalancing) and counts the TraCI commands
+sent to SUMO per decision step, in total and inside the state retrieval (set_taxi_to_region,
+get_demand_attr). Every command is one socket round-trip; libsumo has none.
+
+Usage:
+    python benchmark_traci.py --steps 20
+"""
+import argparse
+import time
+import numpy as np
+from traci.connection import Connection
+from hydra import initialize, compose
+from train import setup_sumo
+from src.envs.sim.sumo_backend import traci, use_backend
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--steps", type=int, default=20, help="decision steps per mode")
+parser.add_argument("--seed", type=int, default=10)
+args = parser.parse_args()
+
+with initialize(version_base=None, config_path="src/config"):
+    cfg = compose(config_name="config", overrides=[
+        "simulator=sumo", "model=no_rebalancing", "model.cplexpath=None", f"simulator.seed={args.seed}",
+        "simulator.directory=benchmark", "simulator.sumo_backend=traci",
+    ])
+env, _ = setup_sumo(cfg)
+sumo_cmd = [
+    "sumo", "--no-internal-links", "-c", env.cfg.sumocfg_file,
+    "--step-length", str(env.cfg.sumo_tstep),
+    "--device.taxi.dispatch-algorithm", "traci",
+    "-b", str(env.cfg.time_start * 60 * 60), "--seed", str(env.cfg.seed),
+    "-W", "true", "-v", "false",
+]
+
+# count every command sent over the TraCI socket
+counts = {"total": 0, "state": 0}
+in_state = [False]
+send_cmd = Connection._sendCmd
+
+
+def counting_send_cmd(self, *args, **kwargs):
+    counts["total"] += 1
+    if in_state[0]:
+        counts["state"] += 1
+    return send_cmd(self, *args, **kwargs)
+
+
+Connection._sendCmd = counting_send_cmd
+for name in ("set_taxi_to_region", "get_demand_attr"):
+    method = getattr(env, name)
+
+    def counted(*a, _method=method, **kw):
+        in_state[0] = True
+        try:
+            return _method(*a, **kw)
+        finally:
+            in_state[0] = False
+
+    setattr(env, name, counted)
+
+modes = [("traci", False), ("traci", True)]
+try:
+    import libsumo
+    modes.append(("libsumo", False))
+except ImportError:
+    print("libsumo not installed, skipping the in-process backend")
+
+print(f"{'backend':>8} {'subscriptions':>14} {'round-trips/step':>17} {'state retrieval':>16} {'s/step':>8}")
+for backend, subscriptions in modes:
+    use_backend(backend)
+    env.traci_subscriptions = subscriptions
+    np.random.seed(args.seed)
+    traci.start(sumo_cmd)
+    env.reset()
+    per_step, per_state, durations = [], [], []
+    for _ in range(args.steps):
+        counts["total"] = counts["state"] = 0
+        start = time.perf_counter()
+        _, _, done, _ = env.step(reb_action=[0] * len(env.edges))
+        durations.append(time.perf_counter() - start)
+        per_step.append(counts["total"])
+        per_state.append(counts["state"])
+        if done:
+            break
+    if not done:
+        traci.close()
+    print(f"{backend:>8} {str(subscriptions):>14} {np.mean(per_step):>17.1f} {np.mean(per_state):>16.1f} {np.mean(durations):>8.3f}")
@@ -2,12 +2,11 @@ from collections import defaultdict
 import subprocess
 import os
 import sys
-if 'SUMO_HOME' in os.environ:
-    sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
-import traci
+from src.envs.sim.sumo_backend import traci
 import re
 from tqdm import trange
 from src.misc.utils import mat2str
+from src.misc.offline_dataset import rebalancing_to_action
 import numpy as np
 
 
@@ -152,11 +151,13 @@ class MPC:
 
         return paxAction, rebAction
 
-    def test(self, num_episodes, env):
+    def test(self, num_episodes, env, recorder=None, seeds=None):
         """
         for testing MPC
         - num_episodes: An integer representing the number of episodes to run the test.
         - env: The AMoD environment object that contains various attributes and methods.
+        - recorder: optional TransitionRecorder, records every rebalancing decision (state after matching).
+        - seeds: optional per-episode random seeds (default: simulator.seed, simulator.seed + 1, ...).
         """
         sim = env.cfg.name
         if sim == "sumo":
@@ -182,7 +183,8 @@ class MPC:
         episode_reward = []
         episode_served_demand = []
         episode_rebalancing_cost = []
-        seeds = list(range(env.cfg.seed, env.cfg.seed + num_episodes+1))
+        if seeds is None:
+            seeds = list(range(env.cfg.seed, env.cfg.seed + num_episodes+1))
         inflows = []
         for i_episode in epochs:
             eps_reward = 0
@@ -193,14 +195,16 @@ class MPC:
             inflow = np.zeros(env.nregion)
             done = False
             if sim =='sumo':
-                traci.start(sumo_cmd)
+                env.start_sumo(sumo_cmd)
             _ = env.reset_old()
+            rebreward = 0
             
             while not done:
                 
                 if sim == 'sumo':
                     # Taxis information
-                    env.time = int(((traci.simulation.getTime() - env.scenario.time_start * 60) // 60) - env.tstep)
+                    env.sim_time = traci.simulation.getTime()
+                    env.time = int(((env.sim_time - env.scenario.time_start * 60) // 60) - env.tstep)
                     taxi_ids = traci.vehicle.getTaxiFleet(0)
                     env.set_taxi_to_region(taxi_ids)
                     # Info initialization
@@ -211,6 +215,8 @@ class MPC:
                     pax_action, reb_action = self.MPC_exact(env, True)
                     # Environment step
                     _, paxreward, done, info = env.pax_step(paxAction=pax_action, CPLEXPATH=self.cplexpath)
+                    if recorder is not None:
+                        recorder.decision(env, rebalancing_to_action(env, reb_action), rebreward + paxreward)
                     _, rebreward, done, info = env.reb_step(reb_action)
                     env.sumo_steps()
                     env.check_reb_completion()  # ← 이 줄 추가!
@@ -218,15 +224,20 @@ class MPC:
                     if done:
                         env.save_congestion_analysis()  # ← 이 한 줄만 추가
                         traci.simulationStep()
-                        traci.close()
+                        env.close_sumo()
                 else:
                     pax_action, reb_action = self.MPC_exact(env)
 
                     _, paxreward, _, info = env.pax_step(paxAction=pax_action, CPLEXPATH=self.cplexpath)
+                    if recorder is not None:
+                        recorder.decision(env, rebalancing_to_action(env, reb_action), rebreward + paxreward)
 
                     _, rebreward, done, info = env.reb_step(reb_action)
 
                     rew = paxreward + rebreward
+
+                if recorder is not None and done:
+                    recorder.end_episode(env, rebreward)
     
                 for k in range(len(env.edges)):
                     i,j = env.edges[k]
@@ -241,5 +252,7 @@ class MPC:
             episode_rebalancing_cost.append(eps_rebalancing_cost)
             inflows.append(inflow)
             epochs.set_description(f"Test Episode {i_episode+1} | Reward: {eps_reward:.2f} | ServedDemand: {eps_served_demand:.2f} | Reb. Cost: {eps_rebalancing_cost:.2f}")
+        if sim == 'sumo':
+            env.close_sumo(end_of_run=True)
         return episode_reward, episode_served_demand, episode_rebalancing_cost, inflows
         
\ No newline at end of file
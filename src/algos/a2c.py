@@ -10,9 +10,7 @@ from src.algos.reb_flow_solver import solveRebFlow
 import os 
 from tqdm import trange
 import sys
-if 'SUMO_HOME' in os.environ:
-    sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
-import traci
+from src.envs.sim.sumo_backend import traci
 
 SavedAction = namedtuple('SavedAction', ['log_prob', 'value'])
 args = namedtuple('args', ('render', 'gamma', 'log_interval'))
@@ -168,7 +166,7 @@ class A2C(nn.Module):
                     path=f"ckpt/{cfg.model.checkpoint_path}_best.pth"
                 )
 
-    def test(self, test_episodes, env, verbose = True):
+    def test(self, test_episodes, env, verbose = True, recorder=None, seeds=None):
         sim = env.cfg.name
         if sim == "sumo":
             # traci.close(wait=False)
@@ -203,9 +201,11 @@ class A2C(nn.Module):
             eps_served_demand = 0
             eps_rebalancing_cost = 0
             eps_rebalancing_veh = 0
+            if seeds is not None:
+                np.random.seed(seeds[i_episode])
             done = False
             if sim =='sumo':
-                traci.start(sumo_cmd)
+                env.start_sumo(sumo_cmd)
             obs, rew = env.reset()  # initialize environment
             eps_reward += rew
             eps_served_demand += rew
@@ -224,7 +224,11 @@ class A2C(nn.Module):
                     desiredAcc,
                     self.cplexpath,
                 )
+                if recorder is not None:
+                    recorder.decision(env, action_rl, rew)
                 obs, rew, done, info = env.step(reb_action=reb_action)
+                if recorder is not None and done:
+                    recorder.end_episode(env, rew)
                
                 for k in range(len(env.edges)):
                     i,j = env.edges[k]
@@ -245,6 +249,8 @@ class A2C(nn.Module):
             episode_actions.append(np.mean(actions, axis=0))
             episode_inflows.append(inflow)
             #episode_rebalanced_vehicles.append(eps_rebalancing_veh)
+        if sim == 'sumo':
+            env.close_sumo(end_of_run=True)
 
         return (
             episode_reward,
@@ -1,9 +1,8 @@
 import os
 import sys
-if 'SUMO_HOME' in os.environ:
-    sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
-import traci
+from src.envs.sim.sumo_backend import traci
 from tqdm import trange
+from src.misc.offline_dataset import rebalancing_to_action
 import numpy as np
 class BaseAlgorithm:
     def __init__(self, **kwargs):
@@ -28,7 +27,7 @@ class BaseAlgorithm:
 
         raise NotImplementedError("The select_action method must be implemented by subclasses.")
 
-    def test(self, num_episodes, env):
+    def test(self, num_episodes, env, recorder=None, seeds=None):
         sim = env.cfg.name
         if sim == "sumo":
             # traci.close(wait=False)
@@ -53,7 +52,8 @@ class BaseAlgorithm:
         episode_reward = []
         episode_served_demand = []
         episode_rebalancing_cost = []
-        seeds = list(range(env.cfg.seed, env.cfg.seed + num_episodes+1))
+        if seeds is None:
+            seeds = list(range(env.cfg.seed, env.cfg.seed + num_episodes+1))
         inflows = []
         for i_episode in epochs:
             eps_reward = 0
@@ -64,15 +64,19 @@ class BaseAlgorithm:
             inflow = np.zeros(env.nregion)
             done = False
             if sim =='sumo':
-                traci.start(sumo_cmd)
+                env.start_sumo(sumo_cmd)
             obs, rew = env.reset()
             eps_reward += rew
             eps_served_demand += rew
             while not done:
 
                 reb_action = self.select_action(env)
+                if recorder is not None:
+                    recorder.decision(env, rebalancing_to_action(env, reb_action), rew)
             
                 obs, rew, done, info = env.step(reb_action=reb_action)
+                if recorder is not None and done:
+                    recorder.end_episode(env, rew)
 
                 for k in range(len(env.edges)):
                     i,j = env.edges[k]
@@ -89,5 +93,7 @@ class BaseAlgorithm:
             epochs.set_description(
                 f"Test Episode {i_episode+1} | Reward: {eps_reward:.2f} | ServedDemand: {eps_served_demand:.2f} | Reb. Cost: {eps_rebalancing_cost:.2f}"
             )
+        if sim == 'sumo':
+            env.close_sumo(end_of_run=True)
         return episode_reward, episode_served_demand, episode_rebalancing_cost, inflows
         
\ No newline at end of file
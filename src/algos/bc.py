@@ -5,7 +5,7 @@ from src.algos.reb_flow_solver import solveRebFlow
 from src.misc.utils import dictsum
 from src.nets.actor import GNNActor
 import os 
-import traci
+from src.envs.sim.sumo_backend import traci
 from tqdm import trange
 import torch.nn.functional as F
 class BC(nn.Module):
@@ -46,6 +46,9 @@ class BC(nn.Module):
             self.input_size, self.hidden_size, act_dim=self.act_dim
         ).to(self.device)
         print(self.actor)
+        # the region graph is fixed: normalize it once instead of in every GCNConv call
+        if getattr(parser, 'edge_index', None) is not None:
+            self.actor.set_topology(parser.edge_index, dense=(cfg.gnn_layer if hasattr(cfg, 'gnn_layer') else 'sparse') == 'dense')
         
         self.optimizers = self.configure_optimizers()
     
@@ -102,7 +105,7 @@ class BC(nn.Module):
 
         return optimizers
 
-    def test(self, test_episodes, env, verbose = True):
+    def test(self, test_episodes, env, verbose = True, recorder=None, seeds=None):
         sim = env.cfg.name
         if sim == "sumo":
             # traci.close(wait=False)
@@ -130,7 +133,8 @@ class BC(nn.Module):
         episode_served_demand = []
         episode_rebalancing_cost = []
         episode_rebalanced_vehicles = []
-        seeds = list(range(env.cfg.seed, env.cfg.seed + test_episodes+1))
+        if seeds is None:
+            seeds = list(range(env.cfg.seed, env.cfg.seed + test_episodes+1))
         episode_actions = []
         episode_inflows = []
         for i_episode in epochs:
@@ -142,7 +146,7 @@ class BC(nn.Module):
             np.random.seed(seeds[i_episode])
             done = False
             if sim =='sumo':
-                traci.start(sumo_cmd)
+                env.start_sumo(sumo_cmd)
             obs, rew = env.reset()  # initialize environment
             obs = self.parser.parse_obs(obs).to(self.device)
             eps_reward += rew
@@ -161,7 +165,11 @@ class BC(nn.Module):
                     desiredAcc,
                     self.cplexpath,
                 )
+                if recorder is not None:
+                    recorder.decision(env, action_rl, rew, state=obs.x)
                 new_obs, rew, done, info = env.step(reb_action=reb_action)
+                if recorder is not None and done:
+                    recorder.end_episode(env, rew)
                 #calculate inflow to each node in the graph
                
                 for k in range(len(env.edges)):
@@ -185,7 +193,8 @@ class BC(nn.Module):
             episode_actions.append(np.mean(actions, axis=0))
             episode_inflows.append(inflow)
             #episode_rebalanced_vehicles.append(eps_rebalancing_veh)
-        
+        if sim == 'sumo':
+            env.close_sumo(end_of_run=True)
 
         return (
             episode_reward,
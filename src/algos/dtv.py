@@ -1,6 +1,6 @@
 from src.algos.base import BaseAlgorithm
 from pulp import LpProblem, LpMinimize, LpVariable, lpSum, LpBinary, value, LpStatus, PULP_CBC_CMD
-import traci
+from src.envs.sim.sumo_backend import traci
 class DTV(BaseAlgorithm):
     def __init__(self, **kwargs):
         """
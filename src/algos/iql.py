@@ -7,7 +7,7 @@ from src.nets.actor import GNNActor
 from src.nets.critic import GNNCritic, GNNVF
 import copy
 import os 
-import traci
+from src.envs.sim.sumo_backend import traci
 from tqdm import trange
 
 class IQL(nn.Module):
@@ -66,6 +66,12 @@ class IQL(nn.Module):
 
         self.vf = GNNVF(in_channels=self.input_size, act_dim=self.act_dim).to(self.device)
 
+        # the region graph is fixed: normalize it once instead of in every GCNConv call
+        if getattr(parser, 'edge_index', None) is not None:
+            dense = (cfg.gnn_layer if hasattr(cfg, 'gnn_layer') else 'sparse') == 'dense'
+            for net in (self.actor, self.critic1, self.critic2, self.vf):
+                net.set_topology(parser.edge_index, dense=dense)
+
         self.critic1_target = (
             copy.deepcopy(self.critic1).requires_grad_(False).to(device)
         )
@@ -226,7 +232,7 @@ class IQL(nn.Module):
         optimizers["v_optimizer"] = torch.optim.Adam(v_params, lr=self.q_lr)
         return optimizers
 
-    def test(self, test_episodes, env, verbose = True):
+    def test(self, test_episodes, env, verbose = True, recorder=None, seeds=None):
         sim = env.cfg.name
         if sim == "sumo":
             # traci.close(wait=False)
@@ -255,7 +261,8 @@ class IQL(nn.Module):
         episode_served_demand = []
         episode_rebalancing_cost = []
         episode_rebalanced_vehicles = []
-        seeds = list(range(env.cfg.seed, env.cfg.seed + test_episodes+1))
+        if seeds is None:
+            seeds = list(range(env.cfg.seed, env.cfg.seed + test_episodes+1))
         episode_actions = []
         episode_inflows = []
         for i_episode in epochs:
@@ -267,7 +274,7 @@ class IQL(nn.Module):
             np.random.seed(seeds[i_episode])
             done = False
             if sim =='sumo':
-                traci.start(sumo_cmd)
+                env.start_sumo(sumo_cmd)
             obs, rew = env.reset()  # initialize environment
             obs = self.parser.parse_obs(obs).to(self.device)
             eps_reward += rew
@@ -287,7 +294,11 @@ class IQL(nn.Module):
                     desiredAcc,
                     self.cplexpath,
                 )
+                if recorder is not None:
+                    recorder.decision(env, action_rl, rew, state=obs.x)
                 new_obs, rew, done, info = env.step(reb_action=reb_action)
+                if recorder is not None and done:
+                    recorder.end_episode(env, rew)
                 #calculate inflow to each node in the graph
 
                 for k in range(len(env.edges)):
@@ -311,7 +322,8 @@ class IQL(nn.Module):
             episode_actions.append(np.mean(actions, axis=0))
             episode_inflows.append(inflow)
             #episode_rebalanced_vehicles.append(eps_rebalancing_veh)
-        
+        if sim == 'sumo':
+            env.close_sumo(end_of_run=True)
 
         return (
             episode_reward,
@@ -1,14 +1,31 @@
 import os
 import subprocess
 from collections import defaultdict
+import numpy as np
+import networkx as nx
+from scipy.optimize import linprog
+from scipy.sparse import coo_matrix, block_diag
 from src.misc.utils import mat2str
 from pulp import LpMinimize, LpProblem, LpVariable, lpSum, LpStatus, value
 import pulp
+try:
+    import highspy
+except ImportError:
+    highspy = None
 
-def solveRebFlow(env,res_path,desiredAcc,CPLEXPATH):
+def solveRebFlow(env,res_path,desiredAcc,CPLEXPATH,return_info=False):
+    """
+    Solves the soft-constraint rebalancing LP (minRebDistRebOnly.mod) with the configured solver.
+    If return_info is True, also returns {'objective': float, 'shortage': {region: shortage}} (None on failure).
+    """
     #CPLEXPATH='None'
-    if CPLEXPATH=='None':
-        return solveRebFlow_pulp(env, desiredAcc)
+    reb_solver = getattr(env.cfg, 'reb_solver', 'auto')
+    if reb_solver == 'highs':
+        return solveRebFlow_highs(env, desiredAcc, return_info)
+    if reb_solver == 'network':
+        return solveRebFlow_network(env, desiredAcc, return_info)
+    if CPLEXPATH=='None' or reb_solver == 'pulp':
+        return solveRebFlow_pulp(env, desiredAcc, return_info)
     else: 
         t = env.time
         accRLTuple = [(n,int(round(desiredAcc[n]))) for n in desiredAcc]
@@ -41,11 +58,12 @@ def solveRebFlow(env,res_path,desiredAcc,CPLEXPATH):
             print(f"⚠️ CPLEX rebalancing failed at t={t} (exit code {e.returncode})")
             print(f"   Returning zero rebalancing (no vehicles moved)")
             action = [0 for _ in env.edges]
-            return action
+            return (action, None) if return_info else action
 
 
         # 3. collect results from file
         flow = defaultdict(float)
+        info = {'objective': None, 'shortage': {}}
         with open(resfile,'r', encoding="utf8") as file:
             for row in file:
                 item = row.strip().strip(';').split('=')
@@ -56,12 +74,21 @@ def solveRebFlow(env,res_path,desiredAcc,CPLEXPATH):
                             continue
                         i,j,f = v.split(',')
                         flow[int(i),int(j)] = float(f)
+                elif item[0].strip() == 'ObjectiveValue':
+                    info['objective'] = float(item[1])
+                elif item[0] == 'shortage':
+                    values = item[1].strip(')]').strip('[(').split(')(')
+                    for v in values:
+                        if len(v) == 0:
+                            continue
+                        i,f = v.split(',')
+                        info['shortage'][int(i)] = float(f)
 
         action = [flow[i,j] for i,j in env.edges]
 
-        return action
+        return (action, info) if return_info else action
 
-def solveRebFlow_pulp(env, desiredAcc):
+def solveRebFlow_pulp(env, desiredAcc, return_info=False):
 
     t = env.time
     
@@ -80,21 +107,25 @@ def solveRebFlow_pulp(env, desiredAcc):
     region = [n for n in acc_init]
     # Time on each edge (used in the objective)
     time = {(i, j): env.G.edges[i, j]['time'] for i, j in edges}
+    # Penalty per vehicle of unmet target (soft constraint, as in minRebDistRebOnly.mod)
+    penalty = getattr(env.cfg, 'shortage_penalty', 3.0)
 
     # Define the PuLP problem
     model = LpProblem("RebalancingFlowMinimization", LpMinimize)
     
     # Decision variables: rebalancing flow on each edge
     rebFlow = {(i, j): LpVariable(f"rebFlow_{i}_{j}", lowBound=0, cat='Integer') for (i, j) in edges}
+    # Slack variables: amount each region falls below its desired target
+    shortage = {k: LpVariable(f"shortage_{k}", lowBound=0, cat='Continuous') for k in region}
 
-    # Objective: minimize total time (cost) of rebalancing flows
-    model += lpSum(rebFlow[(i, j)] * time[(i, j)] for (i, j) in edges), "TotalRebalanceCost"
+    # Objective: minimize total time (cost) of rebalancing flows + penalty for unmet targets
+    model += lpSum(rebFlow[(i, j)] * time[(i, j)] for (i, j) in edges) + penalty * lpSum(shortage[k] for k in region), "TotalRebalanceCost"
     
     # Constraints for each region (node)
     for k in region:
-        # 1. Flow conservation constraint (ensure net inflow/outflow achieves desired vehicle distribution)
+        # 1. Flow conservation constraint (net inflow/outflow should achieve the desired vehicle distribution, up to shortage)
         model += (
-            lpSum(rebFlow[(j, i)]-rebFlow[(i, j)] for (i, j) in edges if j != i and i==k)
+            lpSum(rebFlow[(j, i)]-rebFlow[(i, j)] for (i, j) in edges if j != i and i==k) + shortage[k]
         ) >= desired_vehicles[k] - acc_init[k], f"FlowConservation_{k}"
 
         # 2. Rebalancing flows from region i should not exceed the available vehicles in region i
@@ -117,8 +148,249 @@ def solveRebFlow_pulp(env, desiredAcc):
         #flow_result = {(i, j): value(rebFlow[(i, j)]) for (i, j) in edges}
         
         action = [flow[i,j] for i,j in env.edges]
+        if return_info:
+            info = {'objective': value(model.objective), 'shortage': {k: shortage[k].varValue for k in region}}
+            return action, info
         return action
     else:
         print(f"Optimization failed with status: {LpStatus[status]}")
-        return None
+        return (None, None) if return_info else None
+
+
+
+class RebFlowSolver:
+    """
+    Persistent in-process solver for the soft-constraint rebalancing LP of one environment
+    (same model as minRebDistRebOnly.mod: rebalancing cost + shortage_penalty * shortage).
+
+    The constraint matrix only depends on the region graph, so it is built once; every call
+    updates the right-hand sides (acc_init, desired_vehicles) and the costs, and re-solves
+    in-process with HiGHS. With highspy installed the model stays loaded and each solve is
+    warm-started from the previous basis, otherwise scipy.optimize.linprog (HiGHS dual simplex)
+    is called on the cached sparse matrix.
+    The constraints form a network (transportation) matrix, so the simplex solution of the LP
+    relaxation is integral and no branch-and-bound is needed.
+
+    With batch_size > 1, batch_size independent instances sharing the topology are stacked into
+    one block-diagonal LP and solved in a single call.
+    """
+
+    def __init__(self, env, batch_size=1):
+        self.region = list(env.region)
+        self.edges = [(i, j) for i, j in env.G.edges if i != j]
+        self.env_edges = list(env.edges)
+        region_idx = {n: k for k, n in enumerate(self.region)}
+        edge_idx = {e: k for k, e in enumerate(self.edges)}
+        self.action_idx = np.array([edge_idx.get(e, -1) for e in self.env_edges])
+        nregion, nedge = len(self.region), len(self.edges)
+        # columns: rebalancing flow per edge, then shortage per region
+        ncol = nedge + nregion
+
+        rows, cols, vals = [], [], []
+        for (i, j), k in edge_idx.items():
+            r = region_idx[i]
+            # 1. flow conservation: outflow - inflow - shortage <= acc_init - desired_vehicles
+            rows += [r, r]
+            cols += [k, edge_idx[j, i]]
+            vals += [1.0, -1.0]
+            # 2. rebalancing flows from a region should not exceed its available vehicles
+            rows.append(nregion + r)
+            cols.append(k)
+            vals.append(1.0)
+        rows += list(range(nregion))
+        cols += list(range(nedge, ncol))
+        vals += [-1.0] * nregion
+        A = coo_matrix((vals, (rows, cols)), shape=(2 * nregion, ncol))
+        self.A = block_diag([A] * batch_size, format="csc") if batch_size > 1 else A.tocsc()
+        self.batch_size = batch_size
+        self.nregion, self.nedge, self.ncol = nregion, nedge, ncol
+        self.highs = self._build_highs() if highspy is not None else None
+
+    def _build_highs(self):
+        h = highspy.Highs()
+        h.setOptionValue("output_flag", False)
+        h.setOptionValue("solver", "simplex")
+        lp = highspy.HighsLp()
+        lp.num_col_ = self.A.shape[1]
+        lp.num_row_ = self.A.shape[0]
+        lp.col_cost_ = np.zeros(self.A.shape[1])
+        lp.col_lower_ = np.zeros(self.A.shape[1])
+        lp.col_upper_ = np.full(self.A.shape[1], highspy.kHighsInf)
+        lp.row_lower_ = np.full(self.A.shape[0], -highspy.kHighsInf)
+        lp.row_upper_ = np.zeros(self.A.shape[0])
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = self.A.indptr
+        lp.a_matrix_.index_ = self.A.indices
+        lp.a_matrix_.value_ = self.A.data
+        h.passModel(lp)
+        self._col_idx = np.arange(self.A.shape[1], dtype=np.int32)
+        self._row_idx = np.arange(self.A.shape[0], dtype=np.int32)
+        self._row_lower = np.full(self.A.shape[0], -highspy.kHighsInf)
+        return h
+
+    def solve(self, acc_init, desired_vehicles, time, shortage_penalty):
+        """
+        acc_init, desired_vehicles: vehicles per region (self.region order), shape (nregion,) or (batch_size, nregion)
+        time: travel time per edge (self.edges order), shape (nedge,) or (batch_size, nedge)
+        Returns (flow per edge in self.edges order, shortage per region, objective), or None if no optimal solution is found.
+        For batched inputs the results have a leading batch dimension.
+        """
+        batched = np.ndim(acc_init) == 2
+        acc_init = np.asarray(acc_init, dtype=float).reshape(self.batch_size, self.nregion)
+        desired_vehicles = np.asarray(desired_vehicles, dtype=float).reshape(self.batch_size, self.nregion)
+        time = np.broadcast_to(np.asarray(time, dtype=float), (self.batch_size, self.nedge))
+        b_ub = np.concatenate((acc_init - desired_vehicles, acc_init), axis=1).ravel()
+        cost = np.concatenate((time, np.full((self.batch_size, self.nregion), float(shortage_penalty))), axis=1).ravel()
+        if self.highs is not None:
+            self.highs.changeColsCost(len(cost), self._col_idx, cost)
+            self.highs.changeRowsBounds(len(b_ub), self._row_idx, self._row_lower, b_ub)
+            self.highs.run()
+            if self.highs.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+                print(f"Optimization failed with status: {self.highs.modelStatusToString(self.highs.getModelStatus())}")
+                return None
+            x = np.array(self.highs.getSolution().col_value)
+        else:
+            res = linprog(cost, A_ub=self.A, b_ub=b_ub, bounds=(0, None), method="highs-ds")
+            if res.status != 0:
+                print(f"Optimization failed with status: {res.message}")
+                return None
+            x = res.x
+        x = np.round(x).reshape(self.batch_size, self.ncol)
+        objective = (cost.reshape(self.batch_size, self.ncol) * x).sum(axis=1)
+        if not batched:
+            return x[0, :self.nedge], x[0, self.nedge:], float(objective[0])
+        return x[:, :self.nedge], x[:, self.nedge:], objective
+
+    def to_action(self, flow):
+        # map flows on self.edges to the env.edges action layout (0 on self-loops)
+        return np.where(self.action_idx >= 0, flow[self.action_idx], 0.0).tolist()
+
+def solveRebFlow_highs(env, desiredAcc, return_info=False):
+    t = env.time
+    solver = getattr(env, 'reb_flow_solver', None)
+    if solver is None or solver.env_edges != env.edges:
+        solver = env.reb_flow_solver = RebFlowSolver(env)
+
+    acc_init = np.array([int(env.acc[n][t+1]) for n in solver.region])
+    desired_vehicles = np.array([int(round(desiredAcc[n])) for n in solver.region])
+    time = [env.G.edges[i, j]['time'] for i, j in solver.edges]
+    penalty = getattr(env.cfg, 'shortage_penalty', 3.0)
+
+    solution = solver.solve(acc_init, desired_vehicles, time, penalty)
+    if solution is None:
+        return (None, None) if return_info else None
+    flow, shortage, objective = solution
+    action = solver.to_action(flow)
+    if return_info:
+        info = {'objective': objective, 'shortage': dict(zip(solver.region, shortage.tolist()))}
+        return action, info
+    return action
+
+def solveRebFlow_batch(env, acc, desiredAcc, time=None, return_info=False):
+    """
+    Solves a batch of rebalancing problems that share the topology of env in one block-diagonal LP
+    (e.g. parallel environments or several policy samples).
+    acc, desiredAcc: arrays of shape (batch, nregion), regions in env.region order
+    time: travel times of shape (batch, len(env.G.edges)) in env.G.edges order (self-loops excluded),
+          defaults to the current travel times of env for every instance
+    Returns the actions as an array of shape (batch, len(env.edges)) (None if the solve fails), and
+    with return_info={'objective': (batch,), 'shortage': (batch, nregion)}.
+    """
+    acc = np.asarray(acc)
+    batch_size = acc.shape[0]
+    solvers = getattr(env, 'reb_flow_batch_solvers', None)
+    if solvers is None:
+        solvers = env.reb_flow_batch_solvers = {}
+    solver = solvers.get(batch_size)
+    if solver is None or solver.env_edges != env.edges:
+        solver = solvers[batch_size] = RebFlowSolver(env, batch_size=batch_size)
+
+    acc_init = acc.astype(int)
+    desired_vehicles = np.round(np.asarray(desiredAcc)).astype(int)
+    if time is None:
+        time = [env.G.edges[i, j]['time'] for i, j in solver.edges]
+    penalty = getattr(env.cfg, 'shortage_penalty', 3.0)
+
+    solution = solver.solve(acc_init, desired_vehicles, time, penalty)
+    if solution is None:
+        return (None, None) if return_info else None
+    flow, shortage, objective = solution
+    action = np.where(solver.action_idx >= 0, flow[:, solver.action_idx], 0.0)
+    if return_info:
+        return action, {'objective': objective, 'shortage': shortage}
+    return action
+
+class RebFlowNetwork:
+    """
+    Min-cost-flow formulation of the soft-constraint rebalancing LP of one environment.
+
+    Every region k supplies acc_init[k] vehicles from an origin node ('o', k). Vehicles either stay
+    (arc to ('d', k), cost 0) or are rebalanced along a graph edge (arc to ('d', j), cost time[k,j]).
+    Each ('d', k) drains into the sink through a reward arc of capacity desired_vehicles[k] and cost
+    -shortage_penalty, plus a free uncapacitated arc for the surplus; covering the target therefore
+    saves the penalty exactly as the shortage slack does. Solved with networkx's network simplex, which
+    returns integral flows without branch-and-bound. The network is built once and only node demands,
+    capacities and costs are updated between calls.
+    """
+
+    def __init__(self, env, cost_scale=1000):
+        self.region = list(env.region)
+        self.edges = [(i, j) for i, j in env.G.edges if i != j]
+        self.env_edges = list(env.edges)
+        # network simplex needs integer weights: costs are scaled and rounded
+        self.cost_scale = cost_scale
+        self.G = nx.DiGraph()
+        for k in self.region:
+            self.G.add_node(('o', k), demand=0)
+            self.G.add_node(('d', k), demand=0)
+            self.G.add_edge(('o', k), ('d', k), weight=0)
+            self.G.add_edge(('d', k), ('t', k), weight=0)
+            self.G.add_edge(('t', k), 'sink', weight=0, capacity=0)
+            self.G.add_edge(('d', k), 'sink', weight=0)
+        self.G.add_node('sink', demand=0)
+        for i, j in self.edges:
+            self.G.add_edge(('o', i), ('d', j), weight=0)
+
+    def solve(self, acc_init, desired_vehicles, time, shortage_penalty):
+        """
+        acc_init, desired_vehicles: {region: vehicles}
+        time: {(i, j): travel time}
+        Returns ({(i, j): flow}, {region: shortage}, objective), or None if the problem is infeasible.
+        """
+        penalty = int(round(shortage_penalty * self.cost_scale))
+        for k in self.region:
+            self.G.nodes['o', k]['demand'] = -int(acc_init[k])
+            self.G.edges[('t', k), 'sink']['capacity'] = max(int(desired_vehicles[k]), 0)
+            self.G.edges[('t', k), 'sink']['weight'] = -penalty
+        self.G.nodes['sink']['demand'] = int(sum(acc_init[k] for k in self.region))
+        for i, j in self.edges:
+            self.G.edges[('o', i), ('d', j)]['weight'] = int(round(time[i, j] * self.cost_scale))
+        try:
+            _, flow_dict = nx.network_simplex(self.G)
+        except nx.NetworkXUnfeasible:
+            print("Optimization failed with status: Infeasible")
+            return None
+        flow = {(i, j): float(flow_dict['o', i]['d', j]) for i, j in self.edges}
+        shortage = {k: float(max(int(desired_vehicles[k]), 0) - flow_dict['t', k]['sink']) for k in self.region}
+        objective = sum(flow[e] * time[e] for e in self.edges) + shortage_penalty * sum(shortage.values())
+        return flow, shortage, objective
+
+def solveRebFlow_network(env, desiredAcc, return_info=False):
+    t = env.time
+    solver = getattr(env, 'reb_flow_network', None)
+    if solver is None or solver.env_edges != env.edges:
+        solver = env.reb_flow_network = RebFlowNetwork(env)
+
+    acc_init = {n: int(env.acc[n][t+1]) for n in solver.region}
+    desired_vehicles = {n: int(round(desiredAcc[n])) for n in solver.region}
+    time = {(i, j): env.G.edges[i, j]['time'] for i, j in solver.edges}
+    penalty = getattr(env.cfg, 'shortage_penalty', 3.0)
 
+    solution = solver.solve(acc_init, desired_vehicles, time, penalty)
+    if solution is None:
+        return (None, None) if return_info else None
+    flow, shortage, objective = solution
+    action = [flow[i, j] if (i, j) in flow else 0.0 for i, j in env.edges]
+    if return_info:
+        return action, {'objective': objective, 'shortage': shortage}
+    return action
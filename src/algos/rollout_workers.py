@@ -0,0 +1,134 @@
+"""
+Rollout worker processes for asynchronous actor/learner SAC training (macro simulator).
+
+Every worker owns its own AMoD + GNNParser, LP/CPLEX file directory (<directory>/worker<rank>) and
+acts with a CPU copy of the actor. The learner publishes new weights into a shared-memory actor
+(RolloutWorkers.sync); workers reload it whenever its version counter changes. Transitions and episode statistics go back to the learner through a
+bounded queue, so the workers block when the learner falls behind.
+"""
+import copy
+import queue
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from src.algos.reb_flow_solver import solveRebFlow
+from src.misc.utils import dictsum
+
+
+def _put(transitions, item, stop):
+    # blocking put that gives up once the learner has asked the workers to stop
+    while not stop.is_set():
+        try:
+            transitions.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def rollout_worker(rank, cfg, shared_actor, version, transitions, stop):
+    from train import setup_macro
+
+    torch.set_num_threads(1)
+    # own directory for the LP/CPLEX files, workers solve concurrently
+    directory = cfg.simulator.directory or f"{cfg.model.name}/{cfg.simulator.city}"
+    cfg.simulator.directory = f"{directory}/worker{rank}"
+    env, parser = setup_macro(cfg)
+    # Scenario seeds the global generator with simulator.seed, give every worker its own stream
+    seed = cfg.simulator.seed + 1000 * (rank + 1)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    actor = copy.deepcopy(shared_actor)
+    local_version = -1
+    while not stop.is_set():
+        obs, rew = env.reset()
+        obs = parser.parse_obs(obs)
+        stats = {'reward': rew, 'served_demand': rew, 'rebalancing_cost': 0, 'total_reb_flow': 0, 'total_shortage': 0}
+        done = False
+        while not done:
+            if version.value != local_version:
+                with version.get_lock():
+                    actor.load_state_dict(shared_actor.state_dict())
+                    local_version = version.value
+            with torch.no_grad():
+                action_rl, _ = actor(obs.x, obs.edge_index)
+            action_rl = action_rl.squeeze(-1).numpy()[0]
+            desiredAcc = {env.region[i]: int(action_rl[i] * dictsum(env.acc, env.time + 1))
+                for i in range(len(env.region))
+            }
+            reb_action, reb_info = solveRebFlow(env, env.cfg.directory, desiredAcc, cfg.model.cplexpath, return_info=True)
+            if reb_info is not None:
+                stats['total_shortage'] += sum(reb_info['shortage'].values())
+
+            new_obs, rew, done, info = env.step(reb_action=reb_action)
+            new_obs = parser.parse_obs(new_obs)
+            stats['reward'] += rew
+            stats['served_demand'] += info["profit"]
+            stats['rebalancing_cost'] += info["rebalancing_cost"]
+            stats['total_reb_flow'] += sum(reb_action)
+
+            item = ('transition', obs.x.numpy(), obs.edge_index.numpy(), action_rl, rew, new_obs.x.numpy())
+            if not _put(transitions, item, stop):
+                return
+            obs = new_obs
+        if not _put(transitions, ('episode', rank, stats), stop):
+            return
+
+
+class RolloutWorkers:
+    """
+    Pool of rollout_worker processes feeding one learner.
+    """
+
+    def __init__(self, cfg, actor, num_workers, queue_size=1000):
+        ctx = mp.get_context('spawn')
+        self.shared_actor = copy.deepcopy(actor).cpu()
+        self.shared_actor.share_memory()
+        self.version = ctx.Value('l', 0)
+        self.transitions = ctx.Queue(maxsize=queue_size)
+        self.stop = ctx.Event()
+        self.processes = [
+            ctx.Process(target=rollout_worker, args=(rank, cfg, self.shared_actor, self.version, self.transitions, self.stop), daemon=True)
+            for rank in range(num_workers)
+        ]
+        for p in self.processes:
+            p.start()
+
+    def sync(self, actor):
+        """
+        Publish the learner's actor weights to the workers.
+        """
+        with self.version.get_lock():
+            with torch.no_grad():
+                for p_shared, p in zip(self.shared_actor.state_dict().values(), actor.state_dict().values()):
+                    p_shared.copy_(p.detach().cpu())
+            self.version.value += 1
+
+    def drain(self, block=False, max_items=1000):
+        """
+        Messages currently queued by the workers (waits for at least one if block is set).
+        """
+        items = []
+        try:
+            if block:
+                items.append(self.transitions.get(timeout=60))
+            while len(items) < max_items:
+                items.append(self.transitions.get_nowait())
+        except queue.Empty:
+            if block and not items and not any(p.is_alive() for p in self.processes):
+                raise RuntimeError("all rollout workers exited")
+        return items
+
+    def close(self, timeout=10):
+        self.stop.set()
+        # keep emptying the queue: a worker only exits once its buffered items are flushed
+        deadline = time.time() + timeout
+        while any(p.is_alive() for p in self.processes) and time.time() < deadline:
+            self.drain()
+            for p in self.processes:
+                p.join(timeout=0.1)
+        for p in self.processes:
+            if p.is_alive():
+                p.terminate()
@@ -5,16 +5,16 @@ import torch.nn.functional as F
 from torch_geometric.data import Data, Batch
 from src.algos.reb_flow_solver import solveRebFlow
 from src.misc.utils import dictsum
-from src.nets.actor import GNNActor, GNNActorLSTM
-from src.nets.critic import GNNCritic, GNNCriticLSTM
+from src.nets.actor import GNNActor, GNNActorLSTM, compile_actor
+from src.nets.critic import GNNCritic, GNNCriticLSTM, critic_ensemble
 import random
 from tqdm import trange
 import os
 import sys
-if 'SUMO_HOME' in os.environ:
-    sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
-import traci
+from src.envs.sim.sumo_backend import traci
 import pickle
+from src.misc.offline_dataset import is_dataset, load_dataset
+from src.misc.cpu_perf import solver_affinity
 
 class PairData(Data):
     """
@@ -39,22 +39,60 @@ class PairData(Data):
         else:
             return super().__inc__(key, value, *args, **kwargs)
 
+class PairBatch(Data):
+    """
+    Batch of transitions gathered from ReplayData, laid out like
+    Batch.from_data_list(<PairData list>, follow_batch=['x_s', 'x_t']).
+    """
+
+
 class ReplayData:
     """
     Replay buffer for SAC agents
+
+    Fixed-capacity ring buffer: states are kept in preallocated (capacity, regions, features)
+    tensors, actions and rewards in flat tensors. The graph topology is the same for every
+    transition, so only one edge_index is stored and the batched edge indices are built once
+    per batch size; sampling is a plain index gather.
+
+    Offline datasets in the columnar format of src/misc/offline_dataset.py are not loaded:
+    batches are read straight from the memory-mapped arrays.
     """
 
-    def __init__(self, device):
+    def __init__(self, device, capacity=100000):
         self.device = device
-        self.data_list = []
-        self.rewards = []
+        self.capacity = capacity
+        self.ptr = 0
+        self.num_samples = 0
+        self.edge_index = None
+        self._batched_edges = {}
+        self.memmap = False
+        self.rew_scale = 1.0
+
+    def _allocate(self, edge_index, x, action):
+        self.edge_index = edge_index.to(self.device)
+        self.nodes = x.size(0)
+        self.x_s = torch.zeros((self.capacity,) + tuple(x.shape), dtype=torch.float32, device=self.device)
+        self.x_t = torch.zeros_like(self.x_s)
+        self.action = torch.zeros((self.capacity, action.numel()), dtype=torch.float32, device=self.device)
+        self.reward = torch.zeros(self.capacity, dtype=torch.float32, device=self.device)
 
     def store(self, data1, action, reward, data2):
-        self.data_list.append(PairData(data1.edge_index, data1.x, torch.as_tensor(
-            reward), torch.as_tensor(action), data2.edge_index, data2.x))
-        self.rewards.append(reward)
+        action = torch.as_tensor(np.asarray(action, dtype=np.float32)) if isinstance(action, list) else torch.as_tensor(action)
+        if self.edge_index is None:
+            self._allocate(data1.edge_index, data1.x, action)
+        i = self.ptr
+        self.x_s[i] = data1.x
+        self.x_t[i] = data2.x
+        self.action[i] = action.reshape(-1)
+        self.reward[i] = float(reward)
+        self.ptr = (self.ptr + 1) % self.capacity
+        self.num_samples = min(self.num_samples + 1, self.capacity)
     
     def create_dataset(self, edge_index, memory_path, rew_scale, size=60000):
+        if is_dataset(f"data/{memory_path}"):
+            self.load_memmap(f"data/{memory_path}", edge_index, rew_scale, size)
+            return
         w = open(f"data/{memory_path}.pkl", "rb")
         data = pickle.load(w)
    
@@ -66,26 +104,92 @@ class ReplayData:
             #data["next_action"]
         )
 
-        for i in range(len(state_batch)):
-            self.data_list.append(
-                PairData(
-                    edge_index,
-                    state_batch[i],
-                    reward_batch[i],
-                    action_batch[i],
-                    edge_index,
-                    next_state_batch[i],
-                    #next_action_batch[i]
-                )
+        num_samples = min(size, len(state_batch)) if size else len(state_batch)
+        self.capacity = max(self.capacity, num_samples)
+        for i in range(num_samples):
+            self.store(
+                Data(state_batch[i], edge_index), action_batch[i], reward_batch[i], Data(next_state_batch[i], edge_index)
             )
 
+    def load_memmap(self, path, edge_index, rew_scale, size=None):
+        """
+        Samples from the memory-mapped dataset at `path` (first `size` samples). The topology stored
+        with the dataset takes precedence over edge_index.
+        """
+        arrays, meta = load_dataset(path)
+        if meta.get("edge_index") is not None:
+            edge_index = torch.tensor(meta["edge_index"])
+        self.memmap = True
+        self.rew_scale = rew_scale
+        self.edge_index = edge_index.long().to(self.device)
+        self.nodes = meta["nodes"]
+        self.x_s, self.x_t = arrays["state"], arrays["next_state"]
+        self.action, self.reward = arrays["action"], arrays["reward"]
+        self.num_samples = min(size, len(self.reward)) if size else len(self.reward)
+        self.capacity = self.num_samples
+
     def size(self):
-        return len(self.data_list)
+        return self.num_samples
+
+    def _gather(self, idx, num_batches):
+        if not self.memmap:
+            idx = torch.as_tensor(idx, device=self.device)
+            return self.x_s[idx], self.x_t[idx], self.reward[idx], self.action[idx]
+        # sorted reads are (mostly) sequential on disk, the order within a batch does not matter
+        idx = np.sort(np.asarray(idx).reshape(num_batches, -1), axis=1).ravel()
+        x_s, x_t, reward, action = (
+            torch.from_numpy(np.ascontiguousarray(array[idx])).to(self.device)
+            for array in (self.x_s, self.x_t, self.reward, self.action)
+        )
+        return x_s, x_t, self.rew_scale * reward, action
+
+    def _batch_edges(self, batch_size):
+        # edge indices of batch_size copies of the graph, offset like Batch.from_data_list
+        if batch_size not in self._batched_edges:
+            offsets = self.nodes * torch.arange(batch_size, device=self.device)
+            edge_index = (self.edge_index.unsqueeze(1) + offsets.view(1, -1, 1)).reshape(2, -1)
+            node_batch = torch.arange(batch_size, device=self.device).repeat_interleave(self.nodes)
+            self._batched_edges[batch_size] = (edge_index, node_batch)
+        return self._batched_edges[batch_size]
 
     def sample_batch(self, batch_size=32):
-        data = random.sample(self.data_list, batch_size)
- 
-        return Batch.from_data_list(data, follow_batch=['x_s', 'x_t']).to(self.device)
+        return self.sample_batches(1, batch_size)[0]
+
+    def sample_batches(self, num_batches, batch_size=32):
+        """
+        num_batches independent batches (each without replacement), gathered from the buffer at once.
+        """
+        idx = [i for _ in range(num_batches) for i in random.sample(range(self.num_samples), batch_size)]
+        edge_index, node_batch = self._batch_edges(batch_size)
+        x_s, x_t, reward, action = self._gather(idx, num_batches)
+        x_s = x_s.reshape(num_batches, -1, x_s.size(-1))
+        x_t = x_t.reshape(num_batches, -1, x_t.size(-1))
+        reward = reward.reshape(num_batches, -1)
+        action = action.reshape(num_batches, -1)
+        return [
+            PairBatch(
+                x_s=x_s[k],
+                edge_index_s=edge_index,
+                x_t=x_t[k],
+                edge_index_t=edge_index,
+                reward=reward[k],
+                action=action[k],
+                x_s_batch=node_batch,
+                x_t_batch=node_batch,
+            )
+            for k in range(num_batches)
+        ]
+
+def repeat_graphs(edge_index, num_graphs, nodes, repeats):
+    """
+    Batched edge_index of num_graphs graphs (nodes nodes and the same number of edges each) with
+    every graph repeated `repeats` times in a row, offset like Batch.from_data_list.
+    """
+    edges = edge_index.view(2, num_graphs, -1)
+    offsets = nodes * torch.arange(num_graphs, device=edge_index.device).view(1, -1, 1)
+    local = (edges - offsets).repeat_interleave(repeats, dim=1)
+    offsets = nodes * torch.arange(num_graphs * repeats, device=edge_index.device).view(1, -1, 1)
+    return (local + offsets).reshape(2, -1)
 
 class Scalar(nn.Module):
     def __init__(self, init_value):
@@ -140,7 +244,7 @@ class SAC(nn.Module):
         self.step = 0
         self.nodes = env.nregion
 
-        self.replay_buffer = ReplayData(device=device)
+        self.replay_buffer = ReplayData(device=device, capacity=cfg.buffer_size if hasattr(cfg, 'buffer_size') else 100000)
         # nnets
   
         if self.use_LSTM:
@@ -164,6 +268,28 @@ class SAC(nn.Module):
         for p in self.critic2_target.parameters():
             p.requires_grad = False
 
+        # the region graph is fixed: normalize it once instead of in every GCNConv call
+        self.gnn_layer = cfg.gnn_layer if hasattr(cfg, 'gnn_layer') else 'sparse'
+        if self.gnn_layer not in ('sparse', 'dense'):
+            raise ValueError(f"Unknown gnn_layer: {self.gnn_layer}")
+        if getattr(parser, 'edge_index', None) is not None and not self.use_LSTM:
+            for net in (self.actor, self.critic1, self.critic2, self.critic1_target, self.critic2_target):
+                net.set_topology(parser.edge_index, dense=self.gnn_layer == 'dense')
+
+        # evaluate both critics in one batched pass (GNNCritic only)
+        self.fused_critic = (cfg.fused_critic if hasattr(cfg, 'fused_critic') else True) and not self.use_LSTM
+        self.critic_params = list(self.critic1.parameters()) + list(self.critic2.parameters())
+        self.critic_target_params = list(self.critic1_target.parameters()) + list(self.critic2_target.parameters())
+
+        # gradient updates per environment step
+        self.utd_ratio = cfg.utd_ratio if hasattr(cfg, 'utd_ratio') else 1
+        self.updates_due = 0.0
+
+        # exported actor for deterministic test-time inference (None: plain actor forward)
+        self.inference_backend = cfg.inference_backend if hasattr(cfg, 'inference_backend') else None
+        if self.inference_backend and self.use_LSTM:
+            raise ValueError("inference_backend requires the GNNActor (use_LSTM=false)")
+
         self.optimizers = self.configure_optimizers()
 
         # action & reward buffer
@@ -193,6 +319,12 @@ class SAC(nn.Module):
         a = a.detach().cpu().numpy()[0]
         return list(a)
     
+    def twin_q(self, critic1, critic2, state, edge_index, action):
+        if self.fused_critic:
+            q = critic_ensemble([critic1, critic2], state, edge_index, action)
+            return q[0], q[1]
+        return critic1(state, edge_index, action), critic2(state, edge_index, action)
+
     def compute_loss_q(self, data, conservative=False):
         (
             state_batch,
@@ -210,16 +342,14 @@ class SAC(nn.Module):
             data.action.reshape(-1, self.nodes),
         )
 
-        q1 = self.critic1(state_batch, edge_index, action_batch)
-        q2 = self.critic2(state_batch, edge_index, action_batch)
+        q1, q2 = self.twin_q(self.critic1, self.critic2, state_batch, edge_index, action_batch)
 
         if self.wandb is not None:
             self.wandb.log({"Q1": q1.mean().item()})
         with torch.no_grad():
             # Target actions come from *current* policy
             a2, logp_a2 = self.actor(next_state_batch, edge_index2)
-            q1_pi_targ = self.critic1_target(next_state_batch, edge_index2, a2)
-            q2_pi_targ = self.critic2_target(next_state_batch, edge_index2, a2)
+            q1_pi_targ, q2_pi_targ = self.twin_q(self.critic1_target, self.critic2_target, next_state_batch, edge_index2, a2)
             q_pi_targ = torch.min(q1_pi_targ, q2_pi_targ)
 
             backup = reward_batch + self.gamma * (q_pi_targ - self.alpha * logp_a2)
@@ -294,8 +424,7 @@ class SAC(nn.Module):
         )
 
         actions, logp_a = self.actor(state_batch, edge_index)
-        q1_1 = self.critic1(state_batch, edge_index, actions)
-        q2_a = self.critic2(state_batch, edge_index, actions)
+        q1_1, q2_a = self.twin_q(self.critic1, self.critic2, state_batch, edge_index, actions)
         q_a = torch.min(q1_1, q2_a)
 
         if self.use_automatic_entropy_tuning:
@@ -310,32 +439,59 @@ class SAC(nn.Module):
         loss_pi = (self.alpha * logp_a - q_a).mean()
         return loss_pi
 
+    def env_step(self, action_rl):
+        """
+        Applies the desired vehicle distribution action_rl: rebalancing LP, environment step and
+        observation parsing. Returns (reb_action, reb_info, new_obs, reward, done, info).
+        """
+        desiredAcc = {self.env.region[i]: int(action_rl[i] * dictsum(self.env.acc, self.env.time + 1))
+            for i in range(len(self.env.region))
+        }
+        with solver_affinity():
+            reb_action, reb_info = solveRebFlow(
+                self.env,
+                self.env.cfg.directory,
+                desiredAcc,
+                self.cplexpath,
+                return_info=True,
+            )
+            new_obs, rew, done, info = self.env.step(reb_action=reb_action)
+        new_obs = self.parser.parse_obs(new_obs).to(self.device)
+        return reb_action, reb_info, new_obs, rew, done, info
+
+    def run_updates(self, batch_size, only_q=False):
+        """
+        Gradient updates for one environment step. The update-to-data ratio (utd_ratio) may be
+        fractional, leftover updates carry over to the next step. All batches are drawn from the
+        replay buffer with a single gather. Returns a list of (critic_loss, actor_loss).
+        """
+        self.updates_due += self.utd_ratio
+        num_updates = int(self.updates_due)
+        self.updates_due -= num_updates
+        if num_updates == 0:
+            return []
+        return [
+            self.update(data=batch, only_q=only_q)
+            for batch in self.replay_buffer.sample_batches(num_updates, batch_size)
+        ]
+
     def update(self, data, conservative=False, only_q=False):
         loss_q1, loss_q2 = self.compute_loss_q(data, conservative)
 
         self.optimizers["c1_optimizer"].zero_grad()
+        self.optimizers["c2_optimizer"].zero_grad()
 
+        # the critics share no parameters, so one backward pass gives each its own gradient
+        (loss_q1 + loss_q2).backward()
         nn.utils.clip_grad_norm_(self.critic1.parameters(), self.clip)
-        loss_q1.backward(retain_graph=True)
-        self.optimizers["c1_optimizer"].step()
-
-        self.optimizers["c2_optimizer"].zero_grad()
-        loss_q2.backward(retain_graph=True)
         nn.utils.clip_grad_norm_(self.critic2.parameters(), self.clip)
+        self.optimizers["c1_optimizer"].step()
         self.optimizers["c2_optimizer"].step()
 
         # Update target networks by polyak averaging.
         with torch.no_grad():
-            for p, p_targ in zip(
-                self.critic1.parameters(), self.critic1_target.parameters()
-            ):
-                p_targ.data.mul_(self.polyak)
-                p_targ.data.add_((1 - self.polyak) * p.data)
-            for p, p_targ in zip(
-                self.critic2.parameters(), self.critic2_target.parameters()
-            ):
-                p_targ.data.mul_(self.polyak)
-                p_targ.data.add_((1 - self.polyak) * p.data)
+            torch._foreach_mul_(self.critic_target_params, self.polyak)
+            torch._foreach_add_(self.critic_target_params, self.critic_params, alpha=1 - self.polyak)
         if self.wandb is not None:
             self.wandb.log({"Q1 Loss": loss_q1.item()})
         if not only_q:
@@ -375,51 +531,42 @@ class SAC(nn.Module):
             d.log_prob(random_actions).view(batch_size, num_actions, 1).to(self.device)
         )
         random_actions = random_actions.to(self.device)
-        data_list = data.to_data_list()
-        data_list = data_list * num_actions
-        batch_temp = Batch.from_data_list(data_list).to(self.device)
-        current_actions, current_log = self.actor(
-            batch_temp.x_s, batch_temp.edge_index_s
-        )
-        current_log = current_log.view(batch_size, num_actions, 1)
-
-        next_actions, next_log = self.actor(batch_temp.x_t, batch_temp.edge_index_t)
-        next_log = next_log.view(batch_size, num_actions, 1)
-
-        q1_rand = self.critic1(
-            batch_temp.x_s, batch_temp.edge_index_s, random_actions
-        ).view(batch_size, num_actions, 1)
 
-        q2_rand = self.critic2(
-            batch_temp.x_s, batch_temp.edge_index_s, random_actions
-        ).view(batch_size, num_actions, 1)
+        # every state repeated num_actions times: graph b*num_actions + k is a copy of graph b
+        nodes = data.x_s.size(0) // batch_size
+        n = batch_size * num_actions
+        x_s = data.x_s.view(batch_size, nodes, -1).repeat_interleave(num_actions, dim=0).view(n * nodes, -1)
+        x_t = data.x_t.view(batch_size, nodes, -1).repeat_interleave(num_actions, dim=0).view(n * nodes, -1)
+        edge_index = repeat_graphs(data.edge_index_s, batch_size, nodes, num_actions)
 
-        q1_current = self.critic1(
-            batch_temp.x_s, batch_temp.edge_index_s, current_actions
-        ).view(batch_size, num_actions, 1)
-
-        q2_current = self.critic2(
-            batch_temp.x_s, batch_temp.edge_index_s, current_actions
-        ).view(batch_size, num_actions, 1)
-
-        q1_next = self.critic1(
-            batch_temp.x_s, batch_temp.edge_index_s, next_actions
-        ).view(batch_size, num_actions, 1)
-
-        q2_next = self.critic2(
-            batch_temp.x_s, batch_temp.edge_index_s, next_actions
-        ).view(batch_size, num_actions, 1)
+        # current and next policy actions in one actor pass (only their values enter the critic loss)
+        with torch.no_grad():
+            actions, log_prob = self.actor(torch.cat([x_s, x_t]), torch.cat([edge_index, edge_index + n * nodes], dim=1))
+        current_actions, next_actions = actions[:n], actions[n:]
+        current_log = log_prob[:n].view(batch_size, num_actions, 1)
+        next_log = log_prob[n:].view(batch_size, num_actions, 1)
+
+        # random, current and next actions evaluated at the repeated states in one critic pass
+        q1, q2 = self.twin_q(
+            self.critic1,
+            self.critic2,
+            x_s.repeat(3, 1),
+            torch.cat([edge_index + k * n * nodes for k in range(3)], dim=1),
+            torch.cat([random_actions, current_actions, next_actions]),
+        )
+        q1 = q1.view(3, batch_size, num_actions, 1)
+        q2 = q2.view(3, batch_size, num_actions, 1)
         
         return (
             random_log_prob,
             current_log,
             next_log,
-            q1_rand,
-            q2_rand,
-            q1_current,
-            q2_current,
-            q1_next,
-            q2_next,
+            q1[0],
+            q2[0],
+            q1[1],
+            q2[1],
+            q1[2],
+            q2[2],
         )
     
     def configure_optimizers(self):
@@ -491,17 +638,22 @@ class SAC(nn.Module):
             best_reward = -np.inf  # set best reward
             self.train()  # set model in train mode
 
+            executor = None
+            if getattr(cfg.model, "overlap_env_step", False):
+                from concurrent.futures import ThreadPoolExecutor
+                executor = ThreadPoolExecutor(max_workers=1)
+
             # Initialize CSV logging
             import csv
             log_file = f"{checkpoint_folder}/training_log.csv"
             with open(log_file, 'w', newline='') as f:
                 writer = csv.writer(f)
                 writer.writerow(['episode', 'reward', 'served_demand', 'rebalancing_cost', 
-                                'total_reb_flow', 'critic_loss', 'actor_loss'])
+                                'total_reb_flow', 'critic_loss', 'actor_loss', 'total_shortage'])
 
             for i_episode in epochs:
                 if sim =='sumo':
-                    traci.start(sumo_cmd)
+                    self.env.start_sumo(sumo_cmd)
                 obs, rew = self.env.reset()  # initialize environment
                 step = 0
                 obs = self.parser.parse_obs(obs).to(self.device)
@@ -511,6 +663,7 @@ class SAC(nn.Module):
                 episode_rebalancing_cost = 0
                 episode_served_demand += rew
                 episode_total_reb_flow = 0  # Track total rebalancing flow
+                episode_total_shortage = 0  # Track unmet rebalancing targets (soft constraint)
                 episode_critic_loss = []
                 episode_actor_loss = []
                 done = False
@@ -518,34 +671,30 @@ class SAC(nn.Module):
                 while not done:
                     try:
                         action_rl = self.select_action(obs)
-                        desiredAcc = {self.env.region[i]: int(action_rl[i] * dictsum(self.env.acc, self.env.time + 1))
-                            for i in range(len(self.env.region))
-                        }
-                
-                        reb_action = solveRebFlow(
-                            self.env,
-                            self.env.cfg.directory,
-                            desiredAcc,
-                            self.cplexpath,
-                        )
+                        losses = []
+                        if executor is not None:
+                            # step the environment in the background while the learner updates
+                            transition = executor.submit(self.env_step, action_rl)
+                            if i_episode > 10:
+                                losses = self.run_updates(cfg.model.batch_size, only_q=i_episode < cfg.model.only_q_steps)
+                            reb_action, reb_info, new_obs, rew, done, info = transition.result()
+                        else:
+                            reb_action, reb_info, new_obs, rew, done, info = self.env_step(action_rl)
+                        if reb_info is not None:
+                            episode_total_shortage += sum(reb_info['shortage'].values())
 
-                        new_obs, rew, done, info = self.env.step(reb_action=reb_action)
                         step += 1
                         episode_reward += rew
                         episode_served_demand += info["profit"]
                         episode_rebalancing_cost += info["rebalancing_cost"]
                         episode_total_reb_flow += sum(reb_action)  # Track total rebalancing flow
                         
-                        new_obs = self.parser.parse_obs(new_obs).to(self.device)
                         self.replay_buffer.store(obs, action_rl, cfg.model.rew_scale * rew, new_obs)
                         
                         obs = new_obs
-                        if i_episode > 10:
-                            batch = self.replay_buffer.sample_batch(cfg.model.batch_size)
-                            if i_episode < cfg.model.only_q_steps:
-                                critic_loss, actor_loss = self.update(data=batch, only_q=True)
-                            else:
-                                critic_loss, actor_loss = self.update(data=batch)
+                        if executor is None and i_episode > 10:
+                            losses = self.run_updates(cfg.model.batch_size, only_q=i_episode < cfg.model.only_q_steps)
+                        for critic_loss, actor_loss in losses:
                             episode_critic_loss.append(critic_loss)
                             if actor_loss is not None:
                                 episode_actor_loss.append(actor_loss)
@@ -575,7 +724,7 @@ class SAC(nn.Module):
                     writer = csv.writer(f)
                     writer.writerow([i_episode, episode_reward, episode_served_demand, 
                                     episode_rebalancing_cost, episode_total_reb_flow,
-                                    avg_critic_loss, avg_actor_loss])
+                                    avg_critic_loss, avg_actor_loss, episode_total_shortage])
                 
                 if self.wandb is not None:
                         self.wandb.log({"Reward": episode_reward, "Served Demand": episode_served_demand, "Rebalancing Cost": episode_rebalancing_cost, "Step": i_episode})
@@ -593,6 +742,10 @@ class SAC(nn.Module):
                     self.save_checkpoint(
                         path=f"{checkpoint_folder}/best.pth"
                     )
+            if executor is not None:
+                executor.shutdown()
+            if sim == 'sumo':
+                self.env.close_sumo(end_of_run=True)
         
         # Print training summary
         print("\n" + "="*80)
@@ -603,8 +756,170 @@ class SAC(nn.Module):
         print(f"   - best.pth (best reward: {best_reward:.2f})")
         print(f"   - metadata.json")
         print("="*80 + "\n")
-    
-    def test(self, test_episodes, env, verbose = True):
+
+    def learn_vector(self, cfg, venv):
+        """
+        Online training on a VectorAMoD: every step collects one transition per environment
+        (num_envs transitions per model.utd_ratio gradient updates). Episode statistics are averaged over environments.
+        """
+        checkpoint_folder = cfg.checkpoint_folder
+        train_episodes = cfg.model.max_episodes  # set max number of training episodes
+        epochs = trange(train_episodes)  # epoch iterator
+        best_reward = -np.inf  # set best reward
+        self.train()  # set model in train mode
+
+        import csv
+        log_file = f"{checkpoint_folder}/training_log.csv"
+        with open(log_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['episode', 'reward', 'served_demand', 'rebalancing_cost',
+                            'total_reb_flow', 'critic_loss', 'actor_loss', 'total_shortage'])
+
+        for i_episode in epochs:
+            obs, rew = venv.reset()  # initialize environments
+            obs = obs.to(self.device)
+            episode_reward = rew.copy()
+            episode_served_demand = rew.copy()
+            episode_rebalancing_cost = np.zeros(venv.num_envs)
+            episode_total_reb_flow = np.zeros(venv.num_envs)
+            episode_total_shortage = np.zeros(venv.num_envs)  # unmet rebalancing targets (soft constraint)
+            episode_critic_loss = []
+            episode_actor_loss = []
+            done = False
+
+            while not done:
+                with torch.no_grad():
+                    action_rl, _ = self.actor(obs.x, obs.edge_index)
+                action_rl = action_rl.squeeze(-1).cpu().numpy()
+
+                with solver_affinity():
+                    new_obs, rew, dones, infos = venv.step(action_rl)
+                done = dones.all()
+                episode_reward += rew
+                episode_served_demand += [info["profit"] for info in infos]
+                episode_rebalancing_cost += [info["rebalancing_cost"] for info in infos]
+                episode_total_reb_flow += [info["reb_action"].sum() for info in infos]
+                episode_total_shortage += [info["total_shortage"] for info in infos]
+
+                new_obs = new_obs.to(self.device)
+                for k in range(venv.num_envs):
+                    self.replay_buffer.store(obs.get_example(k), list(action_rl[k]), cfg.model.rew_scale * rew[k], new_obs.get_example(k))
+
+                obs = new_obs
+                if i_episode > 10:
+                    for critic_loss, actor_loss in self.run_updates(cfg.model.batch_size, only_q=i_episode < cfg.model.only_q_steps):
+                        episode_critic_loss.append(critic_loss)
+                        if actor_loss is not None:
+                            episode_actor_loss.append(actor_loss)
+
+            epochs.set_description(
+                f"Episode {i_episode+1} | Reward: {episode_reward.mean():.2f} | ServedDemand: {episode_served_demand.mean():.2f} | Reb. Cost: {episode_rebalancing_cost.mean():.2f}"
+            )
+
+            avg_critic_loss = np.mean(episode_critic_loss) if episode_critic_loss else 0
+            avg_actor_loss = np.mean(episode_actor_loss) if episode_actor_loss else 0
+            with open(log_file, 'a', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow([i_episode, episode_reward.mean(), episode_served_demand.mean(),
+                                episode_rebalancing_cost.mean(), episode_total_reb_flow.mean(),
+                                avg_critic_loss, avg_actor_loss, episode_total_shortage.mean()])
+
+            if self.wandb is not None:
+                self.wandb.log({"Reward": episode_reward.mean(), "Served Demand": episode_served_demand.mean(), "Rebalancing Cost": episode_rebalancing_cost.mean(), "Step": i_episode})
+
+            self.save_checkpoint(path=f"{checkpoint_folder}/checkpoint.pth")
+            if (i_episode + 1) % 100 == 0:
+                self.save_checkpoint(path=f"{checkpoint_folder}/checkpoint_ep{i_episode+1}.pth")
+            if episode_reward.mean() > best_reward:
+                best_reward = episode_reward.mean()
+                self.save_checkpoint(path=f"{checkpoint_folder}/best.pth")
+
+    def learn_async(self, cfg):
+        """
+        Asynchronous actor/learner training: cfg.model.num_workers processes roll out episodes
+        (see src/algos/rollout_workers.py) while this process only does gradient updates, one per
+        received transition as in learn() (times model.utd_ratio). Actor weights are pushed to the workers every
+        cfg.model.weight_sync_interval updates.
+        """
+        from src.algos.rollout_workers import RolloutWorkers
+
+        if cfg.simulator.name != "macro":
+            raise ValueError("Asynchronous rollouts are only available for the macro simulator")
+        checkpoint_folder = cfg.checkpoint_folder
+        train_episodes = cfg.model.max_episodes  # set max number of training episodes
+        sync_interval = cfg.model.weight_sync_interval
+        epochs = trange(train_episodes)  # counts episodes finished by any worker
+        best_reward = -np.inf  # set best reward
+        self.train()  # set model in train mode
+
+        import csv
+        log_file = f"{checkpoint_folder}/training_log.csv"
+        with open(log_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['episode', 'reward', 'served_demand', 'rebalancing_cost',
+                            'total_reb_flow', 'critic_loss', 'actor_loss', 'total_shortage', 'worker'])
+
+        workers = RolloutWorkers(cfg, self.actor, cfg.model.num_workers)
+        i_episode = 0
+        updates = 0
+        pending_updates = 0
+        episode_critic_loss = []
+        episode_actor_loss = []
+        try:
+            while i_episode < train_episodes:
+                for msg in workers.drain(block=pending_updates < 1):
+                    if msg[0] == 'transition':
+                        _, x_s, edge_index, action_rl, rew, x_t = msg
+                        edge_index = torch.from_numpy(edge_index)
+                        self.replay_buffer.store(
+                            Data(x=torch.from_numpy(x_s), edge_index=edge_index), list(action_rl),
+                            cfg.model.rew_scale * rew, Data(x=torch.from_numpy(x_t), edge_index=edge_index),
+                        )
+                        if i_episode > 10:
+                            pending_updates += self.utd_ratio
+                        continue
+
+                    _, rank, stats = msg
+                    epochs.set_description(
+                        f"Episode {i_episode+1} | Reward: {stats['reward']:.2f} | ServedDemand: {stats['served_demand']:.2f} | Reb. Cost: {stats['rebalancing_cost']:.2f}"
+                    )
+                    epochs.update(1)
+                    avg_critic_loss = np.mean(episode_critic_loss) if episode_critic_loss else 0
+                    avg_actor_loss = np.mean(episode_actor_loss) if episode_actor_loss else 0
+                    episode_critic_loss, episode_actor_loss = [], []
+                    with open(log_file, 'a', newline='') as f:
+                        writer = csv.writer(f)
+                        writer.writerow([i_episode, stats['reward'], stats['served_demand'],
+                                        stats['rebalancing_cost'], stats['total_reb_flow'],
+                                        avg_critic_loss, avg_actor_loss, stats['total_shortage'], rank])
+                    if self.wandb is not None:
+                        self.wandb.log({"Reward": stats['reward'], "Served Demand": stats['served_demand'], "Rebalancing Cost": stats['rebalancing_cost'], "Step": i_episode})
+
+                    self.save_checkpoint(path=f"{checkpoint_folder}/checkpoint.pth")
+                    if (i_episode + 1) % 100 == 0:
+                        self.save_checkpoint(path=f"{checkpoint_folder}/checkpoint_ep{i_episode+1}.pth")
+                    if stats['reward'] > best_reward:
+                        best_reward = stats['reward']
+                        self.save_checkpoint(path=f"{checkpoint_folder}/best.pth")
+                    i_episode += 1
+                    if i_episode >= train_episodes:
+                        break
+
+                if pending_updates >= 1 and i_episode < train_episodes:
+                    batch = self.replay_buffer.sample_batch(cfg.model.batch_size)
+                    critic_loss, actor_loss = self.update(data=batch, only_q=i_episode < cfg.model.only_q_steps)
+                    episode_critic_loss.append(critic_loss)
+                    if actor_loss is not None:
+                        episode_actor_loss.append(actor_loss)
+                    pending_updates -= 1
+                    updates += 1
+                    if updates % sync_interval == 0:
+                        workers.sync(self.actor)
+        finally:
+            workers.close()
+        epochs.close()
+
+    def test(self, test_episodes, env, verbose = True, recorder=None, seeds=None):
         sim = env.cfg.name
         if sim == "sumo":
             # traci.close(wait=False)
@@ -633,7 +948,8 @@ class SAC(nn.Module):
         episode_served_demand = []
         episode_rebalancing_cost = []
         episode_rebalanced_vehicles = []
-        seeds = list(range(env.cfg.seed, env.cfg.seed + test_episodes+1))
+        if seeds is None:
+            seeds = list(range(env.cfg.seed, env.cfg.seed + test_episodes+1))
         episode_actions = []
         episode_inflows = []
         episode_od_flows = []  # OD pair별 flow 추가
@@ -646,7 +962,7 @@ class SAC(nn.Module):
             np.random.seed(seeds[i_episode])
             done = False
             if sim =='sumo':
-                traci.start(sumo_cmd)
+                env.start_sumo(sumo_cmd)
             obs, rew = env.reset()  # initialize environment
             obs = self.parser.parse_obs(obs).to(self.device)
             eps_reward += rew
@@ -654,9 +970,15 @@ class SAC(nn.Module):
             actions = []
             inflow = np.zeros(len(env.region))
             od_flow = {}  # {(origin, dest): count}
+            if self.inference_backend and i_episode == 0:
+                # export the current weights once per test run
+                act = compile_actor(self.actor, obs.edge_index, self.inference_backend)
             while not done:
                 try:
-                    action_rl = self.select_action(obs, deterministic=True)
+                    if self.inference_backend:
+                        action_rl = act(obs.x)
+                    else:
+                        action_rl = self.select_action(obs, deterministic=True)
                     actions.append(action_rl)
                     desiredAcc = {env.region[i]: int(action_rl[i] * dictsum(env.acc, env.time + 1))
                         for i in range(len(self.env.region))
@@ -667,7 +989,11 @@ class SAC(nn.Module):
                         desiredAcc,
                         self.cplexpath,
                     )
+                    if recorder is not None:
+                        recorder.decision(env, action_rl, rew, state=obs.x)
                     new_obs, rew, done, info = env.step(reb_action=reb_action)
+                    if recorder is not None and done:
+                        recorder.end_episode(env, rew)
                     #calculate inflow to each node in the graph
                    
                     for k in range(len(env.edges)):
@@ -694,6 +1020,8 @@ class SAC(nn.Module):
                             traci.close(wait=False)
                         except:
                             pass
+                        if recorder is not None:
+                            recorder.abort_episode()
                         done = True
                         break
                     else:
@@ -711,7 +1039,8 @@ class SAC(nn.Module):
             episode_inflows.append(inflow)
             episode_od_flows.append(od_flow)  # OD flow 추가
             #episode_rebalanced_vehicles.append(eps_rebalancing_veh)
-        
+        if sim == 'sumo':
+            env.close_sumo(end_of_run=True)
 
         return (
             episode_reward,
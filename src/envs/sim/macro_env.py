@@ -10,6 +10,26 @@ import torch
 from torch_geometric.data import Data
 from pulp import LpMaximize, LpProblem, LpVariable, lpSum, LpStatus, value
 import pulp
+from src.envs.sim.state_store import ArrayStore
+
+def greedy_matching(demand, price, supply, src):
+    """
+    Revenue-maximizing passenger matching: serves each origin's edges in decreasing price order
+    until its vehicles run out (fractional knapsack per origin, exact for the matching LP).
+    demand, price: per edge; supply: per region; src: region index of each edge's origin.
+    Several environments can be matched at once by concatenating their edges and offsetting src.
+    """
+    demand = np.where((demand > 1e-3) & (price > 0), demand, 0.)
+    # sort by origin, then by decreasing price
+    order = np.lexsort((-price, src))
+    d = demand[order]
+    cum = np.cumsum(d)
+    group_start = np.r_[True, src[order][1:] != src[order][:-1]]
+    offset = np.maximum.accumulate(np.where(group_start, cum - d, 0.))
+    served_before = cum - d - offset
+    flow = np.zeros(len(demand))
+    flow[order] = np.clip(supply[src[order]] - served_before, 0., d)
+    return flow
 
 class AMoD:
     # initialization
@@ -25,6 +45,7 @@ class AMoD:
         self.arrDemand = dict()
         self.region = list(self.G) # set of regions
         self.cfg = cfg 
+        self.state_backend = getattr(cfg, 'state_backend', 'dict') # 'dict' (nested defaultdicts) or 'array' (dense NumPy stores)
         for i in self.region:
             self.depDemand[i] = defaultdict(float)
             self.arrDemand[i] = defaultdict(float)
@@ -67,11 +88,71 @@ class AMoD:
         # add the initialization of info here
         self.info = dict.fromkeys(['revenue', 'served_demand', 'rebalancing_cost', 'operating_cost'], 0)
         self.reward = 0
+        if self.state_backend == 'array':
+            self._init_array_state()
+            self._load_trips(scenario.tripAttr)
+            for n in self.region:
+                self.acc[n][0] = self.G.nodes[n]['accInit']
         # observation: current vehicle distribution, time, future arrivals, demand        
         self.obs = (self.acc, self.time, self.dacc, self.demand)
+
+    def _init_array_state(self):
+        """
+        Allocate the dense state backend: one (regions or edges) x time array per quantity,
+        exposed through ArrayStore so that dict-style access (e.g. self.acc[n][t]) keeps working.
+        """
+        horizon = 2*self.tf + 1 # demand is generated for 2*tf steps, stores grow if flows arrive later
+        self.region_idx = {n: k for k, n in enumerate(self.region)}
+        self.edge_idx = {e: k for k, e in enumerate(self.edges)}
+        self.acc = ArrayStore(self.region, horizon)
+        self.dacc = ArrayStore(self.region, horizon)
+        self.rebFlow = ArrayStore(self.edges, horizon)
+        self.paxFlow = ArrayStore(self.edges, horizon)
+        self.demand = ArrayStore(self.edges, horizon)
+        self.price = ArrayStore(self.edges, horizon)
+        self.servedDemand = ArrayStore(self.edges, horizon)
+        # static edge structure used by the vectorized pax_step/reb_step
+        self._edge_src = np.array([self.region_idx[i] for i,j in self.edges])
+        self._edge_dst = np.array([self.region_idx[j] for i,j in self.edges])
+        self._is_reb_edge = np.array([(i,j) in self.G.edges for i,j in self.edges])
+        out_edges = [[] for _ in self.region]
+        for k in range(len(self.edges)):
+            out_edges[self._edge_src[k]].append(k)
+        self._edges_by_origin = -np.ones((len(self.region), max(len(ks) for ks in out_edges)), dtype=int)
+        for r, ks in enumerate(out_edges):
+            self._edges_by_origin[r, :len(ks)] = ks
+        self._edge_time_cache = {}
+
+    def _load_trips(self, tripAttr):
+        # write (origin, destination, time, demand, price) tuples into the demand and price stores
+        if len(tripAttr) == 0:
+            return
+        rows = np.array([self.edge_idx[i,j] for i,j,_,_,_ in tripAttr])
+        ts = np.array([t for _,_,t,_,_ in tripAttr], dtype=int)
+        self.demand.ensure(ts.max())
+        self.price.ensure(ts.max())
+        self.demand.data[rows, ts] = [d for _,_,_,d,_ in tripAttr]
+        self.price.data[rows, ts] = [p for _,_,_,_,p in tripAttr]
+
+    def _reset_array_state(self):
+        for store in (self.acc, self.dacc, self.rebFlow, self.paxFlow, self.demand, self.price, self.servedDemand):
+            store.reset()
+        tripAttr = self.scenario.get_random_demand(reset=True)
+        self.regionDemand= defaultdict(dict)
+        for i,j,t,d,p in tripAttr:
+            if t not in self.regionDemand[i]:
+                self.regionDemand[i][t] = 0
+            else:
+                self.regionDemand[i][t] +=d
+        self._load_trips(tripAttr)
+        self.time = 0
+        for n in self.G:
+            self.acc[n][0] = self.G.nodes[n]['accInit']
     
     def matching(self, CPLEXPATH=None, PATH='', platform = 'linux'):
         #CPLEXPATH = 'None'
+        if getattr(self.cfg, 'matching_solver', 'lp') == 'greedy':
+            return self.matching_greedy()
         if CPLEXPATH=='None':
             return self.matching_pulp()
         else:
@@ -163,8 +244,31 @@ class AMoD:
             print(f"Optimization failed with status: {LpStatus[status]}")
             return None
     
+    def matching_greedy(self):
+        """
+        Exact solution of the matching LP without a solver: the problem decomposes by origin and
+        each origin is a fractional knapsack, so serving edges in decreasing price order until the
+        vehicles in the region run out is optimal. Solved for all origins at once with NumPy.
+        """
+        t = self.time
+        if self.state_backend == 'array':
+            demand = self.demand.column(t)
+            price = self.price.column(t)
+            supply = self.acc.column(t+1)
+            src = self._edge_src
+        else:
+            region_idx = {n: k for k, n in enumerate(self.region)}
+            demand = np.array([self.demand[i,j][t] if (i,j) in self.demand and t in self.demand[i,j] else 0 for i,j in self.edges], dtype=float)
+            price = np.array([self.price[i,j][t] if (i,j) in self.price and t in self.price[i,j] else 0 for i,j in self.edges], dtype=float)
+            supply = np.array([self.acc[n][t+1] for n in self.region], dtype=float)
+            src = np.array([region_idx[i] for i,j in self.edges])
+        flow = greedy_matching(demand, price, supply, src)
+        return flow.tolist()
+
     # pax step
     def pax_step(self, paxAction=None, CPLEXPATH=None, PATH='', platform =  'linux'):
+        if self.state_backend == 'array':
+            return self._pax_step_array(paxAction, CPLEXPATH=CPLEXPATH, PATH=PATH, platform=platform)
         t = self.time
         self.reward = 0
         for i in self.region:
@@ -179,7 +283,7 @@ class AMoD:
         test_rew =0
         for k in range(len(self.edges)):
             i,j = self.edges[k]
-            if (i,j) not in self.demand or t not in self.demand[i,j] or self.paxAction[k]<1e-3:
+            if (i,j) not in self.demand or t not in self.demand[i,j] or self.demand[i,j][t] <= 0 or self.paxAction[k]<1e-3:
                 continue
             # I moved the min operator above, since we want paxFlow to be consistent with paxAction
             #assert paxAction[k] < self.acc[i][t+1] + 1e-3
@@ -202,6 +306,8 @@ class AMoD:
     
     # reb step
     def reb_step(self, rebAction):
+        if self.state_backend == 'array':
+            return self._reb_step_array(rebAction)
         self.info['rebalancing_cost'] = 0
         self.info["operating_cost"] = 0
         t = self.time
@@ -238,6 +344,130 @@ class AMoD:
  
         return self.obs, self.reward, done, self.info
     
+    def _edge_times(self, t):
+        # travel times of all edges at time t as arrays (cached, travel times are fixed per scenario)
+        if t not in self._edge_time_cache:
+            demand_time = np.zeros(len(self.edges))
+            reb_time = np.zeros(len(self.edges), dtype=int)
+            for k, (i,j) in enumerate(self.edges):
+                try:
+                    demand_time[k] = self.demandTime[i,j][t]
+                except KeyError:
+                    pass
+                if self._is_reb_edge[k]:
+                    reb_time[k] = self.rebTime[i,j][t]
+            self._edge_time_cache[t] = (demand_time, reb_time)
+        return self._edge_time_cache[t]
+
+    def _clip_to_supply(self, action, mask, supply):
+        """
+        Clip actions so that outflows never exceed the vehicles available at the origin.
+        Edges leaving the same region are processed in self.edges order (one rank per iteration),
+        which reproduces the sequential min() of the loop implementation exactly.
+        Returns the clipped actions and the remaining vehicles per region.
+        """
+        clipped = action.copy()
+        remaining = supply.copy()
+        for col in self._edges_by_origin.T:
+            ks = col[col >= 0]
+            ks = ks[mask[ks]]
+            if ks.size == 0:
+                continue
+            rows = self._edge_src[ks]
+            take = np.minimum(remaining[rows], action[ks])
+            clipped[ks] = take
+            remaining[rows] -= take
+        return clipped, remaining
+
+    def _pax_step_array(self, paxAction=None, CPLEXPATH=None, PATH='', platform='linux'):
+        # vectorized pax_step for the array backend, same semantics as the loop version
+        t = self.time
+        self.reward = 0
+        self.acc.ensure(t+1)
+        self.acc.data[:, t+1] = self.acc.data[:, t]
+        self.info['served_demand'] = 0
+        self.info['revenue'] = 0
+        self.info['profit'] = 0
+        if paxAction is None:
+            paxAction = self.matching(CPLEXPATH=CPLEXPATH, PATH=PATH, platform=platform)
+        action = np.asarray(paxAction, dtype=float)
+        mask = action >= 1e-3
+        if t >= self.demand.horizon:
+            mask[:] = False
+        else:
+            mask &= self.demand.data[:, t] > 0  # only edges with passengers at t, like the loop version
+        clipped, self.acc.data[:, t+1] = self._clip_to_supply(action, mask, self.acc.data[:, t+1])
+        if isinstance(paxAction, list):
+            for k in np.flatnonzero(mask):
+                paxAction[k] = clipped[k].item()
+            self.paxAction = paxAction
+        else:
+            self.paxAction = np.where(mask, clipped, action)
+
+        ks = np.flatnonzero(mask)
+        a = clipped[ks]
+        demand_time = self._edge_times(t)[0][ks]
+        arrival = t + demand_time.astype(int)
+        price = self.price.data[ks, t]
+        if ks.size:
+            self.servedDemand.data[ks, t] = a
+            self.paxFlow.ensure(arrival.max())
+            self.dacc.ensure(arrival.max())
+            self.paxFlow.data[ks, arrival] = a
+            np.add.at(self.dacc.data, (self._edge_dst[ks], arrival), a)
+        # running sums are accumulated in edge order (cumsum) to match the loop version
+        cost = demand_time*self.beta*a
+        self.info["operating_cost"] = np.cumsum(np.concatenate(([self.info["operating_cost"]], cost)))[-1].item()
+        self.info['served_demand'] = np.cumsum(np.concatenate(([0.], a)))[-1].item()
+        self.reward = np.cumsum(np.concatenate(([0.], a*(price - demand_time*self.beta))))[-1].item()
+        self.info['revenue'] = np.cumsum(np.concatenate(([0.], a*price)))[-1].item()
+        self.info['profit'] = self.reward
+
+        self.obs = (self.acc, self.time, self.dacc, self.demand)
+        done = False
+        return self.obs, max(0,self.reward), done, self.info
+
+    def _reb_step_array(self, rebAction):
+        # vectorized reb_step for the array backend, same semantics as the loop version
+        t = self.time
+        self.reward = 0
+        action = np.asarray(rebAction, dtype=float)
+        mask = self._is_reb_edge
+        self.acc.ensure(t+1)
+        clipped, self.acc.data[:, t+1] = self._clip_to_supply(action, mask, self.acc.data[:, t+1])
+        if isinstance(rebAction, list):
+            for k in np.flatnonzero(mask):
+                rebAction[k] = clipped[k].item()
+            self.rebAction = rebAction
+        else:
+            self.rebAction = np.where(mask, clipped, action)
+
+        ks = np.flatnonzero(mask)
+        a = clipped[ks]
+        reb_time = self._edge_times(t)[1][ks]
+        arrival = t + reb_time
+        if ks.size:
+            self.rebFlow.ensure(arrival.max())
+            self.dacc.ensure(arrival.max())
+            self.rebFlow.data[ks, arrival] = a
+            np.add.at(self.dacc.data, (self._edge_dst[ks], arrival), a)
+        cost = np.cumsum(np.concatenate(([0.], reb_time*self.beta*a)))[-1].item()
+        self.info['rebalancing_cost'] = cost
+        self.info["operating_cost"] = cost
+        self.reward = -cost
+        # arrivals for the next time step, rebalancing then passenger flow of each edge in edge order
+        if t < self.rebFlow.horizon:
+            inflow = np.stack((self.rebFlow.data[:, t], self.paxFlow.column(t)), axis=1).ravel()
+            np.add.at(self.acc.data[:, t+1], np.repeat(self._edge_dst, 2), inflow)
+
+        self.time += 1
+        self.obs = (self.acc, self.time, self.dacc, self.demand)
+        for i,j in self.G.edges:
+            self.G.edges[i,j]['time'] = self.rebTime[i,j][self.time]
+        done = (self.tf == self.time+1)
+
+        return self.obs, self.reward, done, self.info
+
     def step(self, reb_action):
         # transform sample from Dirichlet into actual vehicle counts (i.e. (x1*x2*..*xn)*num_vehicles)
         # Take action in environment
@@ -257,6 +487,12 @@ class AMoD:
     
     def reset(self):
         # reset the episode
+        if self.state_backend == 'array':
+            self._reset_array_state()
+            self.obs = (self.acc, self.time, self.dacc, self.demand)
+            obs, paxreward, done, info = self.pax_step(CPLEXPATH=self.cfg.cplexpath, PATH=self.cfg.directory)
+            self.reward = 0
+            return obs, paxreward
         self.acc = defaultdict(dict)
         self.dacc = defaultdict(dict)
         self.rebFlow = defaultdict(dict)
@@ -299,6 +535,10 @@ class AMoD:
    
     def reset_old(self):
         # reset the episode
+        if self.state_backend == 'array':
+            self._reset_array_state()
+            self.obs = (self.acc, self.time, self.dacc, self.demand)
+            return self.obs
         self.acc = defaultdict(dict)
         self.dacc = defaultdict(dict)
         self.rebFlow = defaultdict(dict)
@@ -558,24 +798,66 @@ class GNNParser():
         if self.json_file is not None:
             with open(json_file,"r") as file:
                 self.data = json.load(file)
-        
-    def parse_obs(self, obs):
-        x = torch.cat((
-            torch.tensor([obs[0][n][self.env.time+1]*self.s for n in self.env.region]).view(1, 1, self.env.nregion).float(), 
-
-            torch.tensor([[(obs[0][n][self.env.time+1] + self.env.dacc[n][t])*self.s for n in self.env.region] \
-                          for t in range(self.env.time+1, self.env.time+self.T+1)]).view(1, self.T, self.env.nregion).float(), 
-
-            torch.tensor([[sum([(self.env.scenario.demand_input[i,j][t])*(self.env.price[i,j][t])*self.s \
-                          for j in self.env.region]) for i in self.env.region] for t in range(self.env.time+1, self.env.time+self.T+1)]).view(1, self.T, self.env.nregion).float()),
-                          
-              dim=1).squeeze(0).view(1+self.T +self.T , self.env.nregion).T
-        
-        if self.json_file is not None:
-            edge_index = torch.vstack((torch.tensor([edge['i'] for edge in self.data["topology_graph"]]).view(1,-1), 
+            self.edge_index = torch.vstack((torch.tensor([edge['i'] for edge in self.data["topology_graph"]]).view(1,-1), 
                                       torch.tensor([edge['j'] for edge in self.data["topology_graph"]]).view(1,-1))).long()
         else:
-            edge_index = torch.cat((torch.arange(self.env.nregion).view(1, self.env.nregion), 
+            self.edge_index = torch.cat((torch.arange(self.env.nregion).view(1, self.env.nregion), 
                                     torch.arange(self.env.nregion).view(1, self.env.nregion)), dim=0).long()
-        data = Data(x, edge_index)
+        self.region_idx = {n: k for k, n in enumerate(self.env.region)}
+        self.x = np.zeros((self.env.nregion, 1 + 2*self.T), dtype=np.float32)
+        self.revenue = None  # (time x region) demand*price forecast of the current episode
+        self.last_time = None
+
+    def revenue_forecast(self):
+        """
+        Scaled expected revenue sum_j demand_input[i,j][t]*price[i,j][t] for every time step and region i.
+        Demand and prices are fixed once the episode is reset, so this is computed once per episode.
+        """
+        env = self.env
+        horizon = 2*env.tf + self.T + 1
+        revenue = np.zeros((horizon, env.nregion))
+        for (i, j), demand in env.scenario.demand_input.items():
+            if i not in self.region_idx or j not in self.region_idx:
+                continue
+            if (i, j) not in env.price:
+                continue
+            if isinstance(env.price, ArrayStore):
+                price = env.price.data[env.price.index[i, j]]
+                for t, d in demand.items():
+                    if 0 <= t < min(horizon, len(price)):
+                        revenue[t, self.region_idx[i]] += d*price[t]
+            else:
+                price = env.price[i, j]
+                for t, d in demand.items():
+                    if 0 <= t < horizon and t in price:
+                        revenue[t, self.region_idx[i]] += d*price[t]
+        return revenue*self.s
+
+    def parse_obs(self, obs):
+        env = self.env
+        # a new episode restarts the clock: recompute the revenue forecast
+        if self.revenue is None or self.last_time is None or env.time <= self.last_time:
+            self.revenue = self.revenue_forecast()
+        self.last_time = env.time
+
+        t0, T = env.time + 1, self.T
+        acc, dacc = obs[0], env.dacc
+        if isinstance(acc, ArrayStore):
+            acc_t = acc.column(t0)
+            future = np.zeros((env.nregion, T))
+            end = min(t0 + T, dacc.horizon)
+            if end > t0:
+                future[:, :end - t0] = dacc.data[:, t0:end]
+        else:
+            acc_t = np.array([acc[n][t0] for n in env.region])
+            future = np.array([[dacc[n][t] for t in range(t0, t0 + T)] for n in env.region]).reshape(env.nregion, T)
+
+        x = self.x
+        x[:, 0] = acc_t*self.s
+        x[:, 1:T+1] = (acc_t[:, None] + future)*self.s
+        revenue = self.revenue[t0:t0+T]
+        x[:, T+1:] = 0
+        x[:, T+1:T+1+len(revenue)] = revenue.T
+        # observations are kept in the replay buffer, hand out a copy of the work buffer
+        data = Data(torch.tensor(x), self.edge_index)
         return data
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+Cache of SUMO routing queries (traci.simulation.findRoute).
+
+Routes are keyed by (from_edge, to_edge, vType, routingMode, time bucket): a query repeated within the
+same bucket of simulated time (bucket seconds) returns the route found by the first one instead of
+running the router again. Entries expire ttl simulated seconds after they were computed, and with the
+episode; with ttl=None they never expire, so later episodes reuse the routes of the same time of day.
+The least recently used entries are evicted beyond max_size.
+
+With refresh_changed, queries made with track_edges=True (the per-step OD travel times in
+AMoD.update_routes) also reuse the route of an earlier bucket as long as the current travel time of
+none of its edges changed by more than change_threshold (relative) since it was computed, so only the
+OD pairs on which traffic actually changed are routed again.
+"""
+from collections import OrderedDict
+from src.envs.sim.sumo_backend import traci, tc
+
+
+class RouteCache:
+    def __init__(self, bucket=300, ttl=None, max_size=100000, refresh_changed=False, change_threshold=0.1):
+        self.bucket = bucket
+        self.ttl = ttl
+        self.max_size = max_size
+        self.refresh_changed = refresh_changed
+        self.change_threshold = change_threshold
+        self.routes = OrderedDict()  # key -> (route, episode, computed at, edge travel times or None)
+        self.latest = {}  # (from_edge, to_edge, vType, routingMode) -> key of its most recent route
+        self.episode = 0
+        self.hits = 0
+        self.misses = 0
+
+    def new_episode(self):
+        """
+        Called at every reset; with a ttl, the routes of previous episodes expire.
+        """
+        self.episode += 1
+
+    def valid(self, entry, now):
+        _, episode, computed_at, _ = entry
+        if self.ttl is None:
+            return True
+        return episode == self.episode and 0 <= now - computed_at <= self.ttl
+
+    def find_route(self, from_edge, to_edge, vType="", depart=-1., routingMode=0, track_edges=False, now=None):
+        """
+        traci.simulation.findRoute(from_edge, to_edge, vType, depart, routingMode) through the cache.
+        now: current simulation time if the caller knows it, otherwise it is asked from SUMO (depart
+        if given), which costs a TraCI round-trip on every lookup.
+        """
+        if now is None:
+            now = depart if depart >= 0 else traci.simulation.getTime()
+        od = (from_edge, to_edge, vType, routingMode)
+        key = od + (int(now // self.bucket),)
+        entry = self.routes.get(key)
+        if entry is not None and self.valid(entry, now):
+            self.routes.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        if track_edges and self.refresh_changed:
+            previous = self.routes.get(self.latest.get(od))
+            if previous is not None and previous[3] is not None and previous[1] == self.episode \
+                    and not self.changed(previous[3]):
+                # same travel times on the whole route: reuse it for this bucket, against the same baseline
+                self.store(od, key, (previous[0], self.episode, now, previous[3]))
+                self.hits += 1
+                return previous[0]
+
+        self.misses += 1
+        route = traci.simulation.findRoute(from_edge, to_edge, vType=vType, depart=depart, routingMode=routingMode)
+        edge_times = self.edge_travel_times(route.edges) if track_edges and self.refresh_changed else None
+        self.store(od, key, (route, self.episode, now, edge_times))
+        return route
+
+    def store(self, od, key, entry):
+        self.routes[key] = entry
+        self.routes.move_to_end(key)
+        self.latest[od] = key
+        while len(self.routes) > self.max_size:
+            self.routes.popitem(last=False)
+
+    def changed(self, edge_times):
+        current = self.edge_travel_times(edge_times)
+        return any(abs(current[e] - t) > self.change_threshold * max(t, 1e-6) for e, t in edge_times.items())
+
+    def edge_travel_times(self, edges):
+        """
+        Current travel time of each edge. Over TraCI the edges are subscribed, their values then come with
+        every simulation step instead of one round-trip per edge.
+        """
+        if traci.in_process:
+            return {e: traci.edge.getTraveltime(e) for e in edges}
+        results = dict(traci.edge.getAllSubscriptionResults())
+        times = {}
+        for e in edges:
+            if e not in results:
+                traci.edge.subscribe(e, (tc.VAR_CURRENT_TRAVELTIME,))
+                results[e] = traci.edge.getSubscriptionResults(e)
+            times[e] = results[e][tc.VAR_CURRENT_TRAVELTIME]
+        return times
+
+    def clear(self):
+        self.routes.clear()
+        self.latest.clear()
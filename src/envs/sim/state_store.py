@@ -0,0 +1,101 @@
+from collections.abc import Mapping, MutableMapping
+from numbers import Integral
+import numpy as np
+
+
+class TimeSeriesView(MutableMapping):
+    """
+    Dict-style view of one row of an ArrayStore, keyed by time step.
+    Reads outside the allocated horizon return 0 (like a defaultdict(float)),
+    writes past the horizon grow the underlying array.
+    """
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, t):
+        data = self._store.data
+        if 0 <= t < data.shape[1]:
+            return data[self._row, t].item()
+        return 0.0
+
+    def __setitem__(self, t, value):
+        self._store.ensure(t)
+        self._store.data[self._row, t] = value
+
+    def __delitem__(self, t):
+        if 0 <= t < self._store.data.shape[1]:
+            self._store.data[self._row, t] = 0.0
+
+    def __contains__(self, t):
+        return isinstance(t, Integral) and 0 <= t < self._store.data.shape[1]
+
+    def __iter__(self):
+        return iter(range(self._store.data.shape[1]))
+
+    def __len__(self):
+        return self._store.data.shape[1]
+
+    def __repr__(self):
+        return f"TimeSeriesView({self._store.labels[self._row]!r})"
+
+
+class ArrayStore(Mapping):
+    """
+    Dense (keys x time) NumPy storage exposing the nested dict interface used by the
+    environment, i.e. store[key][t]. Keys are regions or edges; `index` maps a key to its row.
+    """
+
+    def __init__(self, keys, horizon, dtype=np.float64):
+        self.labels = list(keys)
+        self.index = {k: r for r, k in enumerate(self.labels)}
+        self.data = np.zeros((len(self.labels), max(int(horizon), 1)), dtype=dtype)
+        self._views = {k: TimeSeriesView(self, r) for k, r in self.index.items()}
+
+    def __getitem__(self, key):
+        return self._views[key]
+
+    def __setitem__(self, key, values):
+        # dict-style row assignment, e.g. store[n] = defaultdict(float)
+        row = self.index[key]
+        self.data[row] = 0.0
+        for t, v in dict(values).items():
+            self.ensure(t)
+            self.data[row, t] = v
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def horizon(self):
+        return self.data.shape[1]
+
+    def ensure(self, t):
+        """
+        Grow the time axis (doubling) so that column t exists.
+        """
+        if t < self.data.shape[1]:
+            return
+        new_horizon = max(2 * self.data.shape[1], int(t) + 1)
+        data = np.zeros((self.data.shape[0], new_horizon), dtype=self.data.dtype)
+        data[:, :self.data.shape[1]] = self.data
+        self.data = data
+
+    def reset(self):
+        self.data.fill(0.0)
+
+    def column(self, t):
+        """
+        Values of all keys at time t (a copy, zeros if t is outside the horizon).
+        """
+        if 0 <= t < self.data.shape[1]:
+            return self.data[:, t].copy()
+        return np.zeros(self.data.shape[0], dtype=self.data.dtype)
@@ -0,0 +1,82 @@
+"""
+Single import point for the SUMO Python API:
+
+    from src.envs.sim.sumo_backend import traci, tc
+
+traci is a stand-in for one of two interchangeable modules with the same API (traci.start,
+traci.simulationStep, traci.vehicle, ...):
+- libsumo: SUMO runs inside the Python process, every call is a function call (no socket, no
+  separate sumo process). No sumo-gui, one simulation per process.
+- traci: SUMO runs as a separate process, every call is a round-trip over a TCP socket.
+
+The backend is chosen by use_backend(name) with name "libsumo", "traci" or "auto" (libsumo if
+installed, TraCI otherwise); simulator.sumo_backend in the config, or the environment variable
+SUMO_BACKEND if nothing selects one before the first traci.* call. It must be chosen before
+traci.start.
+"""
+import os
+import sys
+import importlib
+if 'SUMO_HOME' in os.environ:
+    sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
+import traci.constants as tc
+
+BACKENDS = ("libsumo", "traci")
+
+
+class SumoBackend:
+    """
+    Module stand-in: after use(), the attributes of the selected module are bound on the instance,
+    so traci.vehicle.getRoadID(...) costs the same as with a plain `import traci`.
+    """
+
+    def __init__(self):
+        self._name = None
+
+    def __getattr__(self, attr):
+        # only reached for attributes that are not bound yet, i.e. before the first use()
+        if attr.startswith("__") or self._name is not None:
+            raise AttributeError(attr)
+        self.backend
+        return getattr(self, attr)
+
+    def use(self, name="auto"):
+        if name in (None, "auto"):
+            try:
+                importlib.import_module("libsumo")
+                name = "libsumo"
+            except ImportError:
+                name = "traci"
+        assert name in BACKENDS, f"unknown SUMO backend {name}, expected one of {BACKENDS} or auto"
+        if name == self._name:
+            return name
+        if self._name is not None and self.isLoaded():
+            raise RuntimeError(f"cannot switch to {name} while a {self._name} simulation is running")
+        module = importlib.import_module(name)
+        for key in [k for k in vars(self) if k != "_name"]:
+            delattr(self, key)
+        for key, value in vars(module).items():
+            if not key.startswith("__"):
+                setattr(self, key, value)
+        self._name = name
+        return name
+
+    @property
+    def backend(self):
+        if self._name is None:
+            self.use(os.environ.get("SUMO_BACKEND", "auto"))
+        return self._name
+
+    @property
+    def in_process(self):
+        return self.backend == "libsumo"
+
+
+traci = SumoBackend()
+
+
+def use_backend(name="auto"):
+    """
+    Selects the SUMO backend ("libsumo", "traci" or "auto"), returns the name of the one in use.
+    """
+    return traci.use(name)
@@ -21,7 +21,8 @@ import json
 if 'SUMO_HOME' in os.environ:
     sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
 import sumolib
-import traci
+from src.envs.sim.sumo_backend import traci, tc
+from src.envs.sim.route_cache import RouteCache
 import math
 
 from lxml import etree as ET
@@ -33,6 +34,10 @@ from scipy.spatial.distance import cdist
 import torch
 from torch_geometric.data import Data
 
+# taxi variables read at every decision (set_taxi_to_region, check_parking)
+TAXI_VARS = (tc.VAR_POSITION, tc.VAR_NEXT_STOPS2, tc.VAR_ROAD_ID, tc.VAR_SPEED, tc.VAR_STOPSTATE)
+TAXI_VAR_PARAMETERS = {tc.VAR_NEXT_STOPS2: ("i", 0)}  # getStops(taxi_id, limit=0)
+
 
 class AMoD:
     # initialization
@@ -98,6 +103,35 @@ class AMoD:
         self.enable_congestion_tracking = getattr(cfg, 'enable_congestion_tracking', False)
         self.reb_tracking = {}  # {taxi_id: {departure_time, origin, dest, predicted_time}}
         self.congestion_log = []  # List of congestion records
+
+        # read taxi/passenger state through TraCI subscriptions (delivered with every simulation step);
+        # with libsumo every call is in-process, there is no round-trip to save
+        self.traci_subscriptions = getattr(cfg, 'traci_subscriptions', True) and not traci.in_process
+
+        # findRoute results cached per (from edge, to edge, vType, time bucket), shared with the scenario (prices)
+        self.route_cache = None
+        self.sim_time = None  # SUMO time [s] last read by the env (decision step), time bucket of cached routes
+        if getattr(cfg, 'route_cache', False):
+            self.route_cache = RouteCache(
+                bucket=getattr(cfg, 'route_cache_bucket', 300), ttl=getattr(cfg, 'route_cache_ttl', None),
+                max_size=getattr(cfg, 'route_cache_size', 100000),
+                refresh_changed=getattr(cfg, 'route_cache_refresh_changed', False),
+                change_threshold=getattr(cfg, 'route_cache_change_threshold', 0.1))
+        scenario.route_cache = self.route_cache
+
+        # SUMO instance across episodes: "restart" (traci.start every episode), "reload" (traci.load in the
+        # running instance) or "state" (restore a snapshot taken once the taxis are placed)
+        self.sumo_episodes = getattr(cfg, 'sumo_episodes', 'restart')
+        if self.sumo_episodes == 'state' and scenario.is_meso:
+            print("sumo_episodes=state: SUMO cannot restore taxis of the mesoscopic model, using reload")
+            self.sumo_episodes = 'reload'
+        self.sumo_cmd = None
+        self.sumo_state = None
+        # TraCI port and connection label (None/default: any free port, the default connection)
+        self.sumo_port = getattr(cfg, 'sumo_port', None)
+        self.sumo_label = getattr(cfg, 'sumo_label', None) or 'default'
+        self.sumo_state_file = getattr(cfg, 'sumo_state_file', None) or \
+            f'saved_files/sumo_output/{cfg.city}/episode_state_{os.getpid()}.xml.gz'
         
         # observation: current vehicle distribution, time, future arrivals, demand
         self.obs = (self.acc, self.time, self.dacc, self.demand)
@@ -254,7 +288,7 @@ class AMoD:
                 taxi_id = taxi[0]
                 edge = traci.vehicle.getRoadID(taxi_id)
             traci.vehicle.dispatchTaxi(taxi_id, [reservation_id])
-            route = traci.simulation.findRoute(edge_o, edge_d, vType='taxi')
+            route = self.find_route(edge_o, edge_d, vType='taxi')
             demand_time = int(math.ceil(route.travelTime / (traci.vehicle.getSpeedFactor(taxi_id) * 60)))
         else:
             distance = self.get_taxi_by_distance(region=o, trip=reservation)
@@ -263,7 +297,7 @@ class AMoD:
                 taxi = distance[taxi_num][0]
                 taxi_id = taxi[0]
                 edge = traci.vehicle.getRoadID(taxi_id)
-                route_pickup = traci.simulation.findRoute(edge, edge_o, vType='taxi')
+                route_pickup = self.find_route(edge, edge_o, vType='taxi')
                 # Dispatch and taxi remove from the region
                 if route_pickup.edges:
                     traci.vehicle.dispatchTaxi(taxi_id, [reservation_id])
@@ -275,7 +309,7 @@ class AMoD:
                         break
                     else:
                         continue
-            route = traci.simulation.findRoute(edge_o, edge_d, vType='taxi')
+            route = self.find_route(edge_o, edge_d, vType='taxi')
             demand_time = int(math.ceil((route.travelTime + route_pickup.travelTime) / (traci.vehicle.getSpeedFactor(taxi_id) * 60)))
 
         arrival_time = t + demand_time  # Use the speed factor to have a more accurate forecast of the travel time
@@ -363,7 +397,8 @@ class AMoD:
         
         # ✅ Update time ONCE at the beginning of each step
         tstep = self.tstep
-        self.time = int(((traci.simulation.getTime() - self.scenario.time_start * 60) // 60) - tstep)
+        self.sim_time = traci.simulation.getTime()
+        self.time = int(((self.sim_time - self.scenario.time_start * 60) // 60) - tstep)
         
         rew = 0
         # Matching step (prioritize current passengers)
@@ -375,7 +410,7 @@ class AMoD:
         # Check for episode end
         if done:
             self.save_congestion_analysis()  # Save before closing
-            traci.close()
+            self.close_sumo()
             return obs, rew, done, info
         # Simulation step
         self.sumo_steps()
@@ -389,6 +424,64 @@ class AMoD:
         
         return obs, rew, done, info
 
+    def start_sumo(self, sumo_cmd):
+        """
+        Starts the simulation of a new episode, in place of traci.start(sumo_cmd): with sumo_episodes
+        reload/state a running SUMO instance started with the same command is reused.
+        """
+        cmd = list(sumo_cmd)
+        if self.sumo_label != 'default':
+            # parallel instances (evaluation workers): one set of output files per connection
+            for k in range(len(cmd) - 1):
+                if cmd[k].endswith('-output'):
+                    cmd[k + 1] = cmd[k + 1].replace('.xml', f'.{self.sumo_label}.xml')
+        if self.sumo_episodes != 'restart' and traci.isLoaded() and sumo_cmd == self.sumo_cmd:
+            if self.sumo_episodes == 'reload':
+                traci.load(cmd[1:])
+            return  # state: restored in reset()
+        if traci.isLoaded():
+            traci.close()
+        if sumo_cmd != self.sumo_cmd:
+            self.sumo_state = None  # the snapshot belongs to another configuration
+        if traci.in_process:
+            traci.start(cmd)
+        else:
+            traci.start(cmd, port=self.sumo_port, label=self.sumo_label)
+        self.sumo_cmd = list(sumo_cmd)
+
+    def prepare_sumo(self):
+        """
+        sumo_episodes=state: restores the snapshot of the network with the taxis placed, or takes it in the
+        first episode. Returns True if the taxis are in place.
+        """
+        if self.sumo_episodes != 'state':
+            return False
+        if self.sumo_state is not None:
+            # SUMO crashes restoring a state over open taxi reservations, remove the passengers first
+            for person_id in traci.person.getIDList():
+                traci.person.remove(person_id)
+            traci.simulationStep()
+            traci.simulation.loadState(self.sumo_state)
+        else:
+            self.scenario.set_taxi_lines()
+            self.scenario.set_taxi_distribution()
+            os.makedirs(os.path.dirname(self.sumo_state_file) or '.', exist_ok=True)
+            traci.simulation.saveState(self.sumo_state_file)
+            self.sumo_state = self.sumo_state_file
+        return True
+
+    def close_sumo(self, end_of_run=False):
+        """
+        Ends the episode's simulation. SUMO keeps running between episodes unless sumo_episodes is restart,
+        end_of_run closes it.
+        """
+        if traci.isLoaded() and (end_of_run or self.sumo_episodes == 'restart'):
+            traci.close()
+        if end_of_run and self.sumo_state is not None:
+            if os.path.exists(self.sumo_state):
+                os.remove(self.sumo_state)
+            self.sumo_state = None
+
     def sumo_steps(self):
         """
         Method to run sumo simulation steps until the next decision process
@@ -409,7 +502,7 @@ class AMoD:
         edge_d = self.regions_sumo[d]['in_edges'][np.random.randint(len(self.regions_sumo[d]['in_edges']))].getID()
         edge_d_length = traci.lane.getLength(edge_d + '_0')
         edge_o = traci.vehicle.getRoadID(taxi_id)
-        route = traci.simulation.findRoute(edge_o, edge_d, vType='taxi', routingMode=1)
+        route = self.find_route(edge_o, edge_d, vType='taxi', routingMode=1)
         rebTime = int(math.ceil(route.travelTime / (traci.vehicle.getSpeedFactor(taxi_id) * 60)))
         arrival_time = t + rebTime  # Use the speed factor to have a more accurate forecast of the travel time
         if arrival_time % tstep != 0:
@@ -432,6 +525,8 @@ class AMoD:
         Method to reset the environment with matching in before first env step
         """
         # reset the episode
+        if self.route_cache is not None:
+            self.route_cache.new_episode()
         self.acc = defaultdict(dict)
         self.dacc = defaultdict(dict)
         self.rebFlow = defaultdict(dict)
@@ -447,6 +542,7 @@ class AMoD:
         self.price = defaultdict(dict)  # price
         self.demand_res = defaultdict(dict)  # demand with reservations from sumo
         self.reservations_assigned = list()  # reservation assigned during the episode
+        taxis_placed = self.prepare_sumo()  # before the demand, which is added after a restore
         trip_attr = self.scenario.get_random_demand()
         self.regionDemand = defaultdict(dict)
         for i, j, t, d, p in trip_attr:  # trip attribute (origin, destination, time of request, demand, price)
@@ -481,8 +577,9 @@ class AMoD:
             self.regions_sumo[n]['taxis'] = list()
 
         # Initialize taxis in the network
-        self.scenario.set_taxi_lines()
-        self.scenario.set_taxi_distribution()
+        if not taxis_placed:
+            self.scenario.set_taxi_lines()
+            self.scenario.set_taxi_distribution()
 
         # TODO: define states here
         self.obs = (self.acc, self.time, self.dacc, self.demand, self.unserved_demand)
@@ -491,6 +588,7 @@ class AMoD:
         if self.scenario.is_meso:
             traci.simulationStep()
         self.sumo_steps()
+        self.sim_time = traci.simulation.getTime()
         obs, paxreward, done, info = self.pax_step(CPLEXPATH=self.cfg.cplexpath, PATH=self.cfg.directory)
         return obs, paxreward
 
@@ -499,6 +597,8 @@ class AMoD:
         Method to reset the environment without matching (used for MPC)
         """
         # reset the episode
+        if self.route_cache is not None:
+            self.route_cache.new_episode()
         self.acc = defaultdict(dict)
         self.dacc = defaultdict(dict)
         self.rebFlow = defaultdict(dict)
@@ -514,6 +614,7 @@ class AMoD:
         self.price = defaultdict(dict)  # price
         self.demand_res = defaultdict(dict)  # demand with reservations from sumo
         self.reservations_assigned = list()  # reservation assigned during the episode
+        taxis_placed = self.prepare_sumo()  # before the demand, which is added after a restore
         trip_attr = self.scenario.get_random_demand()
         self.regionDemand = defaultdict(dict)
         for i, j, t, d, p in trip_attr:  # trip attribute (origin, destination, time of request, demand, price)
@@ -548,8 +649,9 @@ class AMoD:
             self.regions_sumo[n]['taxis'] = list()
 
         # Initialize taxis in the network
-        self.scenario.set_taxi_lines()
-        self.scenario.set_taxi_distribution()
+        if not taxis_placed:
+            self.scenario.set_taxi_lines()
+            self.scenario.set_taxi_distribution()
 
         # TODO: define states here
         self.obs = (self.acc, self.time, self.dacc, self.demand, self.unserved_demand)
@@ -558,6 +660,7 @@ class AMoD:
         if self.scenario.is_meso:
             traci.simulationStep()
         self.sumo_steps()
+        self.sim_time = traci.simulation.getTime()
         return self.obs
 
     def get_demand_attr(self):
@@ -569,12 +672,17 @@ class AMoD:
         # Get the reservations demand
         self.reservations = list()
         reservations = traci.person.getTaxiReservations(3)  # Consider only the retrived reservations (the reservation in progress are not appended)
+        if self.traci_subscriptions:
+            person_state = self.subscribed(traci.person, [trip.persons[0] for trip in reservations], (tc.VAR_WAITING_TIME,))
         demandAttr = []
         trips = []
         for trip in reservations:
             trip_id = trip.id
             persons = trip.persons[0]
-            waiting_time = traci.person.getWaitingTime(persons)
+            if self.traci_subscriptions:
+                waiting_time = person_state[persons][tc.VAR_WAITING_TIME]
+            else:
+                waiting_time = traci.person.getWaitingTime(persons)
             if waiting_time > self.max_waiting_time * 60:
                 traci.person.remove(persons)
                 persons = ''
@@ -585,7 +693,7 @@ class AMoD:
             price = self.price[o, d][t]
             # Update the price in case the route has not the same origin-destination as the initial one (due to randomness)
             if price == 0:
-                price = self.scenario.get_price(t, trip)
+                price = self.scenario.get_price(t, trip, now=self.sim_time)
             state = trip.state
             # Check for already assigned trips
             if state >= 4:
@@ -620,12 +728,13 @@ class AMoD:
         Method to update the travel time in the network
         """
         new_routes = defaultdict(tuple)
+        now = self.sim_time = traci.simulation.getTime()
         for o, d in self.edges:
             # Get travel time from the o-d route from the sumo net
             if (o, d) in self.taxi_routes:
                 edge_o = self.taxi_routes[(o, d)][0][0]
                 edge_d = self.taxi_routes[(o, d)][0][1]
-                route = traci.simulation.findRoute(edge_o, edge_d, vType='taxi', depart=traci.simulation.getTime(), routingMode=1)
+                route = self.find_route(edge_o, edge_d, vType='taxi', depart=now, routingMode=1, track_edges=True)
                 new_routes[(o, d)] = ((edge_o, edge_d), route.edges, route.travelTime)
                 self.demand_time[o, d][time] = new_routes[(o, d)][2] / 60
                 self.demand_time[o, d][time] = max(int(math.ceil(self.demand_time[o, d][time])), 1)
@@ -635,20 +744,32 @@ class AMoD:
                 self.rebTime[o, d][time] = 0
         self.taxi_routes = new_routes
 
+    def find_route(self, from_edge, to_edge, vType='', depart=-1., routingMode=0, track_edges=False):
+        """
+        traci.simulation.findRoute, through the route cache if enabled
+        """
+        if self.route_cache is not None:
+            return self.route_cache.find_route(from_edge, to_edge, vType, depart, routingMode, track_edges, now=self.sim_time)
+        return traci.simulation.findRoute(from_edge, to_edge, vType=vType, depart=depart, routingMode=routingMode)
+
     def set_taxi_to_region(self, taxi_ids):
         """
         Method to assign the avaiable taxi to the relative region
         """
         taxi_info = []
+        taxi_state = None
+        if self.traci_subscriptions:
+            taxi_state = self.subscribed(traci.vehicle, taxi_ids, TAXI_VARS, TAXI_VAR_PARAMETERS)
         for taxi_id in taxi_ids:
-            stop = traci.vehicle.getStops(taxi_id)
+            state = taxi_state[taxi_id] if taxi_state is not None else None
+            stop = state[tc.VAR_NEXT_STOPS2] if state is not None else traci.vehicle.getStops(taxi_id)
             stop_info = stop[0].actType
             # Ignore in-rebalancing taxis
             if stop_info == 'rebalancing':
-                parking = self.check_parking(taxi_id, stop)
+                parking = self.check_parking(taxi_id, stop, state)
                 if not parking:
                     continue
-            position = traci.vehicle.getPosition(taxi_id)
+            position = state[tc.VAR_POSITION] if state is not None else traci.vehicle.getPosition(taxi_id)
             taxi_info.append((taxi_id, stop_info, position))
 
         # Batch process the position
@@ -674,20 +795,37 @@ class AMoD:
             distance.append((taxi, taxi_distance))
         return sorted(distance, key=lambda x: x[1])
 
-    def check_parking(self, taxi_id, stop):
+    def check_parking(self, taxi_id, stop, state=None):
         """
         Method to check if the vehicle is in parking mode
+        (state: subscription results of the taxi, queried from SUMO if None)
         """
         if self.scenario.is_meso:
             stop_edge = stop[0].lane.split('_')[0]
-            taxi_edge = traci.vehicle.getRoadID(taxi_id)
-            taxi_spd = traci.vehicle.getSpeed(taxi_id)
+            taxi_edge = state[tc.VAR_ROAD_ID] if state is not None else traci.vehicle.getRoadID(taxi_id)
+            taxi_spd = state[tc.VAR_SPEED] if state is not None else traci.vehicle.getSpeed(taxi_id)
             if stop_edge == taxi_edge and taxi_spd == 0:
                 return True
             else:
                 return False
+        elif state is not None:
+            return (state[tc.VAR_STOPSTATE] & 2) == 2  # isStoppedParking
         else:
             return traci.vehicle.isStoppedParking(taxi_id)
+
+    def subscribed(self, domain, object_ids, var_ids, parameters=None):
+        """
+        Subscription results {object_id: {var_id: value}} of object_ids in a TraCI domain
+        (traci.vehicle, traci.person). SUMO sends them with every simulation step, so reading them
+        costs no round-trip; objects seen for the first time are subscribed (one round-trip, which
+        also returns their current values). Subscriptions end with the object or the connection.
+        """
+        results = dict(domain.getAllSubscriptionResults())
+        for object_id in object_ids:
+            if object_id not in results:
+                domain.subscribe(object_id, var_ids, parameters=parameters)
+                results[object_id] = domain.getSubscriptionResults(object_id)
+        return results
     
     def check_reb_completion(self):
         """Check if tracked rebalancing trips have completed and log congestion"""
@@ -840,6 +978,7 @@ class Scenario:
         self.rebTime = defaultdict(dict)
         self.time_start = time_start * 60
         self.duration = duration * 60
+        self.route_cache = None  # set by AMoD
 
         # Time demand between nodes initialization
         for i, j in self.edges:
@@ -1114,12 +1253,16 @@ class Scenario:
 
         return trip_attr
 
-    def get_price(self, t, trip):
+    def get_price(self, t, trip, now=None):
         """
         Method to compute the price, given the time and length of the route
+        (now: current SUMO time if known, spares the route cache a TraCI call)
         """
         t = t / 60
-        route = traci.simulation.findRoute(trip.fromEdge, trip.toEdge, 'taxi')
+        if self.route_cache is not None:
+            route = self.route_cache.find_route(trip.fromEdge, trip.toEdge, 'taxi', now=now)
+        else:
+            route = traci.simulation.findRoute(trip.fromEdge, trip.toEdge, 'taxi')
         length = sumolib.route.getLength(self.sumo_net, route.edges)
         if t <= 5:
             price = 2.75 + 2.86 * length / 1000  # Night tariff (https://www.bettertaxi.com/taxi-fare-calculator/luxemburg/)
@@ -1176,6 +1319,15 @@ class GNNParser:
         if self.json_file is not None:
             with open(json_file, "r") as file:
                 self.data = json.load(file)
+        # Edge index self-connected tensor definition (fixed topology, built once)
+        origin = []
+        destination = []
+        for o in range(self.env.scenario.adjacency_matrix.shape[0]):
+            for d in range(self.env.scenario.adjacency_matrix.shape[1]):
+                if self.env.scenario.adjacency_matrix[o, d] == 1:
+                    origin.append(o)
+                    destination.append(d)
+        self.edge_index = torch.cat([torch.tensor([origin]), torch.tensor([destination])])
 
     def parse_obs(self, obs):
         x = torch.cat((
@@ -1187,23 +1339,8 @@ class GNNParser:
             torch.tensor([obs[4][n][self.env.time] * self.s_dem for n in self.env.region]).view(1, 1, self.env.nregion).float()),
               dim=1).squeeze(0).view(1+self.T+self.T+1, self.env.nregion).T
 
-        ###################
-        # ADDED
-        # Edge index self-connected tensor definition
-        origin = []
-        destination = []
-        for o in range(self.env.scenario.adjacency_matrix.shape[0]):
-            for d in range(self.env.scenario.adjacency_matrix.shape[1]):
-                if self.env.scenario.adjacency_matrix[o, d] == 1:
-                    origin.append(o)
-                    destination.append(d)
-
-        edge_index = torch.cat([torch.tensor([origin]), torch.tensor([destination])])
         # edge_index = torch.cat([torch.tensor([self.env.region]), torch.tensor([self.env.region])])    # Just local region information
-        ##################
-
-
-        data = Data(x, edge_index)
+        data = Data(x, self.edge_index)
         return data
 
     def get_scaling_factors(self):
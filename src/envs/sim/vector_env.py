@@ -0,0 +1,125 @@
+import numpy as np
+from torch_geometric.data import Batch
+from src.envs.sim.macro_env import AMoD, GNNParser, greedy_matching
+from src.algos.reb_flow_solver import solveRebFlow, solveRebFlow_batch
+
+
+class VectorAMoD:
+    """
+    N independent macro environments of the same scenario stepped in lockstep.
+
+    Every environment uses the array state backend and its own random stream (seeded with seeds[k]),
+    so demand differs between environments. step() takes the desired vehicle distributions of all
+    environments, solves all rebalancing problems in one batched LP (solveRebFlow_batch; with
+    reb_solver=pulp or network one solve per environment instead) and, with matching_solver=greedy,
+    matches passengers of all environments in a single greedy_matching call.
+    Observations are returned as one torch_geometric Batch with one graph per environment.
+    """
+
+    def __init__(self, scenario, cfg, beta, num_envs, seeds=None, T=10, json_file=None):
+        self.num_envs = num_envs
+        self.cfg = cfg
+        self.envs = [AMoD(scenario, cfg=cfg, beta=beta) for _ in range(num_envs)]
+        if self.envs[0].state_backend != 'array':
+            raise ValueError("VectorAMoD requires simulator.state_backend=array")
+        # auto/highs: one block-diagonal HiGHS LP for all environments (CPLEX is not used)
+        self.reb_solver = getattr(cfg, 'reb_solver', 'auto')
+        if self.reb_solver not in ('auto', 'highs', 'pulp', 'network'):
+            raise ValueError(f"VectorAMoD does not support reb_solver={self.reb_solver}, expected auto, highs, pulp or network")
+        self.parsers = [GNNParser(env, T=T, json_file=json_file) for env in self.envs]
+        if seeds is None:
+            seeds = [cfg.seed + k for k in range(num_envs)]
+        self.rng_states = [np.random.RandomState(sd).get_state() for sd in seeds]
+
+        env = self.envs[0]
+        self.nregion = env.nregion
+        self.region = env.region
+        self.edges = env.edges
+        # edge origins of all environments, offset so that every environment has its own regions
+        self._batch_src = (env._edge_src[None, :] + env.nregion * np.arange(num_envs)[:, None]).ravel()
+
+    @property
+    def time(self):
+        return self.envs[0].time
+
+    def acc(self, t):
+        """
+        Vehicles per region at time t, shape (num_envs, nregion).
+        """
+        return np.stack([env.acc.column(t) for env in self.envs])
+
+    def _with_rng(self, k, fn, *args, **kwargs):
+        # run fn with environment k's random stream (Scenario draws demand from np.random)
+        global_state = np.random.get_state()
+        np.random.set_state(self.rng_states[k])
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.rng_states[k] = np.random.get_state()
+            np.random.set_state(global_state)
+
+    def _matching(self):
+        # passenger actions of all environments at the current time step
+        if getattr(self.cfg, 'matching_solver', 'lp') != 'greedy':
+            return [None] * self.num_envs
+        t = self.time
+        demand = np.concatenate([env.demand.column(t) for env in self.envs])
+        price = np.concatenate([env.price.column(t) for env in self.envs])
+        # pax_step matches the vehicles of time t, copied to t+1 before matching
+        supply = self.acc(t).ravel()
+        flow = greedy_matching(demand, price, supply, self._batch_src)
+        return [list(f) for f in flow.reshape(self.num_envs, -1)]
+
+    def _solve_each(self, desiredAcc):
+        # one rebalancing solve per environment with the configured solver (pulp or network)
+        actions, shortage = [], []
+        for env, desired in zip(self.envs, desiredAcc):
+            action, info = solveRebFlow(env, self.cfg.directory, dict(zip(env.region, desired)), self.cfg.cplexpath, return_info=True)
+            actions.append(action)
+            shortage.append([info['shortage'][n] for n in env.region])
+        return np.array(actions), {'shortage': np.array(shortage)}
+
+    def _observations(self):
+        return Batch.from_data_list([parser.parse_obs(env.obs) for env, parser in zip(self.envs, self.parsers)])
+
+    def reset(self):
+        """
+        Returns (observations, matching rewards of the first time step).
+        """
+        for k, env in enumerate(self.envs):
+            self._with_rng(k, env._reset_array_state)
+            env.obs = (env.acc, env.time, env.dacc, env.demand)
+        rewards = np.zeros(self.num_envs)
+        for k, (env, paxAction) in enumerate(zip(self.envs, self._matching())):
+            _, rewards[k], _, _ = env.pax_step(paxAction=paxAction, CPLEXPATH=self.cfg.cplexpath, PATH=self.cfg.directory)
+            env.reward = 0
+        return self._observations(), rewards
+
+    def step(self, actions):
+        """
+        actions: desired vehicle distributions, shape (num_envs, nregion), rows summing to 1.
+        Returns (observations, rewards, dones, infos); infos holds the per-environment info dicts
+        plus the rebalancing actions under 'reb_action' and the total unmet rebalancing target
+        (shortage) under 'total_shortage'.
+        """
+        t = self.time
+        acc = self.acc(t+1)
+        desiredAcc = np.floor(np.asarray(actions) * acc.sum(axis=1, keepdims=True))
+        if self.reb_solver in ('auto', 'highs'):
+            reb_actions, reb_info = solveRebFlow_batch(self.envs[0], acc, desiredAcc, return_info=True)
+        else:
+            reb_actions, reb_info = self._solve_each(desiredAcc)
+
+        rewards = np.zeros(self.num_envs)
+        infos = []
+        for k, env in enumerate(self.envs):
+            _, rebreward, _, _ = env.reb_step(reb_actions[k].tolist())
+            rewards[k] = rebreward
+            infos.append({'rebalancing_cost': -rebreward, 'total_shortage': float(reb_info['shortage'][k].sum())})
+        for k, (env, paxAction) in enumerate(zip(self.envs, self._matching())):
+            _, paxreward, _, _ = env.pax_step(paxAction=paxAction, CPLEXPATH=self.cfg.cplexpath, PATH=self.cfg.directory)
+            rewards[k] += paxreward
+            infos[k]['profit'] = paxreward
+            infos[k]['reb_action'] = reb_actions[k]
+        dones = np.array([env.tf == env.time+1 for env in self.envs])
+        return self._observations(), rewards, dones, infos
@@ -0,0 +1,59 @@
+"""
+CPU performance settings for training without CUDA.
+
+configure_cpu sets the PyTorch intra-/inter-op thread pools and pins the learner to torch_cores.
+The LP solvers (rebalancing and matching, in-process HiGHS or CBC/CPLEX subprocesses) are run
+inside solver_affinity(), which moves the calling thread to solver_cores for the duration of the
+solve, so that solver subprocesses inherit those cores and do not compete with PyTorch's threads.
+Core pinning uses os.sched_setaffinity (Linux); elsewhere it is skipped.
+"""
+import os
+from contextlib import contextmanager
+import torch
+
+_torch_cores = None
+_solver_cores = None
+
+
+def _set_affinity(cores):
+    # pid 0: the calling thread; threads and processes it creates afterwards inherit the mask
+    if cores is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+
+def configure_cpu(threads=None, interop_threads=None, torch_cores=None, solver_cores=None):
+    """
+    - threads: PyTorch intra-op threads (None: PyTorch default, or len(torch_cores) if pinned)
+    - interop_threads: PyTorch inter-op threads, must be set before any parallel work
+    - torch_cores / solver_cores: lists of CPU ids for the learner and for the LP solvers
+    """
+    global _torch_cores, _solver_cores
+    _torch_cores = set(torch_cores) if torch_cores else None
+    _solver_cores = set(solver_cores) if solver_cores else None
+    # pin before the thread pools are created, their threads inherit the mask
+    _set_affinity(_torch_cores)
+    if threads is None and _torch_cores is not None:
+        threads = len(_torch_cores)
+    if threads is not None:
+        torch.set_num_threads(threads)
+    if interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            print("cpu_interop_threads ignored: the inter-op thread pool is already running")
+
+
+@contextmanager
+def solver_affinity():
+    """
+    Runs the enclosed LP solves on solver_cores (no-op if configure_cpu set none).
+    """
+    if _solver_cores is None or not hasattr(os, "sched_setaffinity"):
+        yield
+        return
+    previous = os.sched_getaffinity(0)
+    _set_affinity(_solver_cores)
+    try:
+        yield
+    finally:
+        _set_affinity(previous)
@@ -0,0 +1,297 @@
+"""
+Columnar on-disk format for offline RL datasets (CQL/IQL/BC).
+
+A dataset is a directory holding one .npy file per field, opened with np.load(mmap_mode="r"),
+and a small JSON header:
+
+    data/<name>/
+        meta.json        {"version", "num_samples", "nodes", "features", "action_dim", "edge_index"}
+        state.npy        float32 (num_samples, nodes, features)
+        action.npy       float32 (num_samples, action_dim)
+        reward.npy       float32 (num_samples,)   unscaled, rew_scale is applied when sampling
+        next_state.npy   float32 (num_samples, nodes, features)
+
+edge_index is the (2, E) topology shared by all samples (None if unknown).
+
+Convert an existing pickle dataset ({"state", "action", "reward", "next_state"}) with
+    python -m src.misc.offline_dataset convert data/dataset.pkl data/dataset --scenario src/envs/data/macro/scenario_nyc_brooklyn.json
+
+Rollouts are recorded with TransitionRecorder, which appends chunks under data/<name>/parts/<writer>/
+(one writer per process, so several test runs can record into the same dataset at once).
+compact_dataset merges the chunks, and any previously compacted samples, into the format above:
+    python -m src.misc.offline_dataset compact data/dataset
+"""
+import argparse
+import contextlib
+import fcntl
+import glob
+import json
+import os
+import pickle
+import socket
+import uuid
+import numpy as np
+
+FIELDS = ("state", "action", "reward", "next_state")
+VERSION = 1
+
+
+def _as_array(values):
+    # lists of tensors/arrays (the pickle layout) or a single array/tensor
+    if isinstance(values, (list, tuple)):
+        return np.stack([np.asarray(v, dtype=np.float32) for v in values])
+    return np.asarray(values, dtype=np.float32)
+
+
+def write_meta(path, num_samples, nodes, features, action_dim, edge_index=None):
+    meta = {
+        "version": VERSION,
+        "num_samples": int(num_samples),
+        "nodes": int(nodes),
+        "features": int(features),
+        "action_dim": int(action_dim),
+        "edge_index": None if edge_index is None else np.asarray(edge_index).astype(int).tolist(),
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def write_dataset(path, state, action, reward, next_state, edge_index=None):
+    """
+    Writes a complete dataset to the directory `path`.
+    """
+    os.makedirs(path, exist_ok=True)
+    arrays = {"state": _as_array(state), "action": _as_array(action), "reward": _as_array(reward).reshape(-1),
+              "next_state": _as_array(next_state)}
+    n = len(arrays["reward"])
+    arrays["action"] = arrays["action"].reshape(n, -1)
+    for name in FIELDS:
+        assert len(arrays[name]) == n, f"{name} has {len(arrays[name])} samples, expected {n}"
+        out = np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+", dtype=np.float32, shape=arrays[name].shape)
+        out[:] = arrays[name]
+        out.flush()
+        del out
+    return write_meta(path, n, arrays["state"].shape[1], arrays["state"].shape[2], arrays["action"].shape[1], edge_index)
+
+
+def load_dataset(path):
+    """
+    Opens a dataset directory. Returns ({field: read-only memmap}, meta).
+    """
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in FIELDS}
+    return arrays, meta
+
+
+def is_dataset(path):
+    return os.path.isfile(os.path.join(path, "meta.json"))
+
+
+def convert_pickle(pkl_path, path, edge_index=None):
+    """
+    Converts a pickled dataset dict {"state", "action", "reward", "next_state"} to the columnar format.
+    """
+    with open(pkl_path, "rb") as f:
+        data = pickle.load(f)
+    return write_dataset(path, data["state"], data["action"], data["reward"], data["next_state"], edge_index)
+
+
+def scenario_edge_index(json_file):
+    """
+    Topology of a macro scenario file, in the layout of GNNParser.
+    """
+    with open(json_file, "r") as f:
+        data = json.load(f)
+    return np.array([[edge["i"] for edge in data["topology_graph"]], [edge["j"] for edge in data["topology_graph"]]])
+
+
+def rebalancing_to_action(env, reb_action):
+    """
+    Desired vehicle distribution (the SAC action) implied by a rebalancing flow on env.edges,
+    for recording policies that output flows directly (MPC, heuristics).
+    """
+    index = {n: k for k, n in enumerate(env.region)}
+    acc = np.array([env.acc[n][env.time + 1] for n in env.region], dtype=float)
+    for k, (i, j) in enumerate(env.edges):
+        if i != j:
+            acc[index[i]] -= reb_action[k]
+            acc[index[j]] += reb_action[k]
+    acc = np.maximum(acc, 0)
+    if acc.sum() <= 0:
+        return np.full(len(acc), 1 / len(acc), dtype=np.float32)
+    return (acc / acc.sum()).astype(np.float32)
+
+
+class TransitionRecorder:
+    """
+    Streams (state, action, reward, next_state) transitions of any policy to disk.
+
+    Transitions are buffered and written in chunks of chunk_size to <path>/parts/<writer_id>/;
+    every recorder gets its own writer directory, so parallel processes can record into the same
+    dataset. Call decision() at every decision of an episode and end_episode() after the last step,
+    then close() and finally compact_dataset(path).
+    """
+
+    def __init__(self, path, parser, chunk_size=10000, writer_id=None):
+        self.path = path
+        self.parser = parser
+        self.chunk_size = chunk_size
+        self.writer_id = writer_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.dir = os.path.join(path, "parts", self.writer_id)
+        os.makedirs(self.dir, exist_ok=True)
+        self.buffer = {name: [] for name in FIELDS}
+        self.num_chunks = 0
+        self.edge_index = None
+        self.pending = None  # (state, action) of the decision waiting for its next state
+
+    def observe(self, env):
+        """
+        Node features of the current environment state (env.obs, whose layout depends on the simulator).
+        """
+        data = self.parser.parse_obs(env.obs)
+        self.edge_index = data.edge_index
+        return data.x
+
+    def add(self, state, action, reward, next_state):
+        for name, value in zip(FIELDS, (state, action, reward, next_state)):
+            self.buffer[name].append(np.asarray(value.cpu() if hasattr(value, "cpu") else value, dtype=np.float32))
+        if len(self.buffer["reward"]) >= self.chunk_size:
+            self.flush()
+
+    def decision(self, env, action, reward=0.0, state=None):
+        """
+        Records a decision: action (desired vehicle distribution) taken in the current state of env.
+        reward is the reward collected since the previous decision and completes its transition.
+        state can be passed if the caller already parsed the observation.
+        """
+        state = self.observe(env) if state is None else state
+        if self.pending is not None:
+            self.add(*self.pending[:2], reward, state)
+        self.pending = (state, action)
+
+    def end_episode(self, env, reward, state=None):
+        """
+        Completes the last transition of the episode with the final state of env.
+        """
+        if self.pending is not None:
+            self.add(*self.pending[:2], reward, self.observe(env) if state is None else state)
+        self.pending = None
+
+    def abort_episode(self):
+        """
+        Drops the open transition of an episode that could not be finished (e.g. SUMO crashed).
+        """
+        self.pending = None
+
+    def flush(self):
+        if not self.buffer["reward"]:
+            return
+        chunk = {name: np.stack(values) for name, values in self.buffer.items()}
+        if self.edge_index is not None:
+            chunk["edge_index"] = np.asarray(self.edge_index.cpu() if hasattr(self.edge_index, "cpu") else self.edge_index)
+        tmp = os.path.join(self.dir, f"{self.num_chunks:06d}.tmp.npz")
+        # compaction of another recorder removes writer directories once they are empty
+        os.makedirs(self.dir, exist_ok=True)
+        try:
+            np.savez(tmp, **chunk)
+        except FileNotFoundError:
+            os.makedirs(self.dir, exist_ok=True)
+            np.savez(tmp, **chunk)
+        # rename so that compaction never sees half-written chunks
+        os.replace(tmp, os.path.join(self.dir, f"{self.num_chunks:06d}.npz"))
+        self.num_chunks += 1
+        self.buffer = {name: [] for name in FIELDS}
+
+    def close(self):
+        self.flush()
+
+
+@contextlib.contextmanager
+def _compaction_lock(path):
+    # one compaction at a time per dataset, released when the process exits
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".compact.lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def compact_dataset(path, remove_parts=True):
+    """
+    Merges all recorded chunks under <path>/parts (and the samples already compacted at <path>)
+    into the columnar dataset at <path>. Returns the new meta header.
+
+    Only the merged chunks are removed, recorders that are still writing keep their directories.
+    """
+    with _compaction_lock(path):
+        return _compact(path, remove_parts)
+
+
+def _compact(path, remove_parts):
+    chunks = sorted(glob.glob(os.path.join(path, "parts", "*", "[0-9]*.npz")))
+    chunks = [c for c in chunks if not c.endswith(".tmp.npz")]
+    segments = []
+    edge_index = None
+    if is_dataset(path):
+        arrays, meta = load_dataset(path)
+        segments.append(arrays)
+        edge_index = meta.get("edge_index")
+    for c in chunks:
+        chunk = np.load(c)
+        segments.append({name: chunk[name] for name in FIELDS})
+        if edge_index is None and "edge_index" in chunk:
+            edge_index = chunk["edge_index"]
+    if not segments:
+        raise FileNotFoundError(f"no recorded transitions under {path}")
+
+    n = sum(len(seg["reward"]) for seg in segments)
+    for name in FIELDS:
+        shape = (n,) + segments[0][name].shape[1:]
+        tmp = os.path.join(path, f"{name}.tmp.npy")
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=shape)
+        start = 0
+        for seg in segments:
+            out[start:start + len(seg[name])] = seg[name]
+            start += len(seg[name])
+        out.flush()
+        del out
+    segments = None
+    for name in FIELDS:
+        os.replace(os.path.join(path, f"{name}.tmp.npy"), os.path.join(path, f"{name}.npy"))
+    state = np.load(os.path.join(path, "state.npy"), mmap_mode="r")
+    action = np.load(os.path.join(path, "action.npy"), mmap_mode="r")
+    meta = write_meta(path, n, state.shape[1], state.shape[2], action.shape[1], edge_index)
+    if remove_parts:
+        for c in chunks:
+            os.remove(c)
+        for d in {os.path.dirname(c) for c in chunks}:
+            try:
+                os.rmdir(d)  # only if empty, i.e. not written to since
+            except OSError:
+                pass
+    return meta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline dataset tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="convert a pickled dataset to the memory-mapped format")
+    convert.add_argument("pickle", help="input .pkl file")
+    convert.add_argument("output", help="output dataset directory")
+    convert.add_argument("--scenario", default=None, help="macro scenario json to take the topology from")
+    compact = commands.add_parser("compact", help="merge recorded chunks into the dataset")
+    compact.add_argument("path", help="dataset directory")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        edge_index = scenario_edge_index(args.scenario) if args.scenario else None
+        meta = convert_pickle(args.pickle, args.output, edge_index)
+        out = args.output
+    else:
+        meta = compact_dataset(args.path)
+        out = args.path
+    print(f"wrote {meta['num_samples']} samples ({meta['nodes']} nodes, {meta['features']} features) to {out}")
@@ -0,0 +1,75 @@
+"""
+Parallel evaluation of a policy in SUMO.
+
+The test episodes are split over N worker processes. Every worker runs its own SUMO instance (a TraCI
+connection labelled eval<k> on its own port, or libsumo in-process), its own copy of the policy loaded
+from the checkpoint as in testing.py, and the episodes k, k+N, k+2N, ... with their seeds from the
+sequential seeds list (simulator.seed, simulator.seed + 1, ...), so that every episode sees the same
+demand as in a sequential test. The results are returned in episode order, in the layout of model.test.
+
+Workers write their LP/CPLEX files to <simulator.directory>/eval<k> and their SUMO outputs with the
+label in the file name, and use one PyTorch thread each.
+"""
+import copy
+import multiprocessing as mp
+import socket
+
+
+def free_ports(n, base_port=None):
+    """
+    n distinct TCP ports: base_port, base_port + 1, ... or free ports chosen by the OS.
+    """
+    if base_port is not None:
+        return [base_port + k for k in range(n)]
+    ports = []
+    while len(ports) < n:
+        with socket.socket() as s:
+            s.bind(("", 0))
+            port = s.getsockname()[1]
+        if port not in ports:
+            ports.append(port)
+    return ports
+
+
+def _evaluate(task):
+    k, cfg, seeds, port = task
+    import torch
+    from testing import setup_sumo, setup_model
+    torch.set_num_threads(1)
+    cfg.simulator.sumo_port = port
+    cfg.simulator.sumo_label = f"eval{k}"
+    directory = cfg.simulator.directory or f"{cfg.model.name}/{cfg.simulator.city}"
+    cfg.simulator.directory = f"{directory}/eval{k}"
+    env, parser = setup_sumo(cfg)
+    model = setup_model(cfg, env, parser, torch.device("cpu"))
+    kwargs = {"seeds": seeds}
+    recorder = None
+    if cfg.get("record_path"):
+        from src.misc.offline_dataset import TransitionRecorder
+        recorder = TransitionRecorder(f"data/{cfg.record_path}", parser)
+        kwargs["recorder"] = recorder
+    results = model.test(len(seeds), env, **kwargs)
+    if recorder is not None:
+        recorder.close()
+    return tuple(list(r) for r in results)
+
+
+def evaluate_parallel(cfg, test_episodes, workers, base_port=None):
+    """
+    Runs test_episodes episodes of the policy configured in cfg (not yet passed through setup_sumo) on
+    `workers` SUMO instances. Returns the per-episode results of model.test (reward, served demand,
+    rebalancing cost, inflows and, for SAC, OD flows), ordered by episode.
+    """
+    seeds = list(range(cfg.simulator.seed, cfg.simulator.seed + test_episodes))
+    workers = max(1, min(workers, test_episodes))
+    ports = free_ports(workers, base_port)
+    tasks = [(k, copy.deepcopy(cfg), seeds[k::workers], ports[k]) for k in range(workers)]
+    with mp.get_context("spawn").Pool(workers) as pool:
+        parts = pool.map(_evaluate, tasks)
+
+    num_fields = min(len(part) for part in parts)
+    results = [[None] * test_episodes for _ in range(num_fields)]
+    for k, part in enumerate(parts):
+        for field in range(num_fields):
+            results[field][k::workers] = part[field]
+    return tuple(results)
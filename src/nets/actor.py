@@ -1,7 +1,10 @@
+import copy
+import torch
 from torch import nn
 import torch.nn.functional as F
 from torch.distributions import Dirichlet
 from torch_geometric.nn import GCNConv
+from src.nets.gcn import dense_gcn_adjacency, CachedGCNAdjacency
 
 class GNNActor(nn.Module):
     """
@@ -16,9 +19,23 @@ class GNNActor(nn.Module):
         self.lin1 = nn.Linear(in_channels, hidden_size)
         self.lin2 = nn.Linear(hidden_size, hidden_size)
         self.lin3 = nn.Linear(hidden_size, 1)
+        self.adjacency = None
+
+    def set_topology(self, edge_index, dense=False):
+        """
+        Caches the GCN normalization of the fixed region graph, reused for every (batched) forward.
+        dense: graph convolution as a batched (N,N) matmul on (B,N,F) instead of message passing.
+        """
+        self.adjacency = CachedGCNAdjacency(edge_index, self.act_dim, dense=dense)
+        self.conv1.normalize = False
+
+    def conv(self, state, edge_index):
+        if self.adjacency is None:
+            return self.conv1(state, edge_index)
+        return self.adjacency(self.conv1, state, edge_index)
 
     def forward(self, state, edge_index, deterministic=False, return_dist=False):
-        out = F.relu(self.conv1(state, edge_index))
+        out = F.relu(self.conv(state, edge_index))
         x = out + state
         x = x.reshape(-1, self.act_dim, self.in_channels)
         x = F.leaky_relu(self.lin1(x))
@@ -35,7 +52,63 @@ class GNNActor(nn.Module):
             action = m.rsample()
             log_prob = m.log_prob(action)
         return action, log_prob
-    
+
+
+class GNNActorInference(nn.Module):
+    """
+    Deterministic GNNActor for evaluation on a fixed region graph. The GCN-normalized adjacency is
+    precomputed, so the graph convolution is a single (N,N) @ (N,F) matmul (dense or sparse).
+    Maps node features (N,F) to the action (N,). Holds a copy of the actor weights.
+    """
+
+    def __init__(self, actor, edge_index, sparse=False):
+        super().__init__()
+        self.conv_lin = copy.deepcopy(actor.conv1.lin)
+        self.conv_bias = nn.Parameter(actor.conv1.bias.detach().clone())
+        self.lin1 = copy.deepcopy(actor.lin1)
+        self.lin2 = copy.deepcopy(actor.lin2)
+        self.lin3 = copy.deepcopy(actor.lin3)
+        self.sparse = sparse
+        adj = dense_gcn_adjacency(edge_index, actor.act_dim, actor.lin1.weight.dtype).to(actor.lin1.weight.device)
+        self.register_buffer("adj", adj.to_sparse() if sparse else adj)
+        self.requires_grad_(False)
+
+    def forward(self, x):
+        h = self.conv_lin(x)
+        if self.sparse:
+            h = torch.sparse.mm(self.adj, h)
+        else:
+            h = torch.mm(self.adj, h)
+        x = F.relu(h + self.conv_bias) + x
+        x = F.leaky_relu(self.lin1(x))
+        x = F.leaky_relu(self.lin2(x))
+        concentration = F.softplus(self.lin3(x)).squeeze(-1)
+        return concentration / (concentration.sum() + 1e-20)
+
+
+def compile_actor(actor, edge_index, backend="script", sparse=False):
+    """
+    Exports a GNNActor for deterministic inference. Returns a function mapping node features (N,F)
+    to the action as a numpy array.
+    - backend: "script" (frozen TorchScript), "compile" (torch.compile) or "eager".
+    - sparse: sparse instead of dense adjacency matmul (large graphs).
+    The export is a snapshot of the current weights, re-export after training the actor.
+    """
+    module = GNNActorInference(actor, edge_index, sparse).eval()
+    if backend == "script":
+        module = torch.jit.script(module)
+        if not sparse:
+            module = torch.jit.freeze(module)
+    elif backend == "compile":
+        module = torch.compile(module)
+    elif backend != "eager":
+        raise ValueError(f"Unknown inference backend: {backend}")
+
+    def act(x):
+        with torch.inference_mode():
+            return module(x).cpu().numpy()
+
+    return act
 
 
 class GNNActorLSTM(nn.Module):
@@ -1,6 +1,8 @@
 from torch import nn
 import torch.nn.functional as F
 from torch_geometric.nn import GCNConv
+from torch_geometric.nn.conv.gcn_conv import gcn_norm
+from src.nets.gcn import CachedGCNAdjacency
 import torch 
 
 
@@ -17,9 +19,23 @@ class GNNCritic(nn.Module):
         self.lin2 = nn.Linear(hidden_size, hidden_size)
         self.lin3 = nn.Linear(hidden_size, 1)
         self.in_channels = in_channels
+        self.adjacency = None
+
+    def set_topology(self, edge_index, dense=False):
+        """
+        Caches the GCN normalization of the fixed region graph, reused for every (batched) forward.
+        dense: graph convolution as a batched (N,N) matmul on (B,N,F) instead of message passing.
+        """
+        self.adjacency = CachedGCNAdjacency(edge_index, self.act_dim, dense=dense)
+        self.conv1.normalize = False
+
+    def conv(self, state, edge_index):
+        if self.adjacency is None:
+            return self.conv1(state, edge_index)
+        return self.adjacency(self.conv1, state, edge_index)
 
     def forward(self, state, edge_index, action):
-        out = F.relu(self.conv1(state, edge_index))
+        out = F.relu(self.conv(state, edge_index))
         x = out + state
         x = x.reshape(-1, self.act_dim, self.in_channels)  # (B,N,21)
         concat = torch.cat([x, action.unsqueeze(-1)], dim=-1)  # (B,N,22)
@@ -30,6 +46,40 @@ class GNNCritic(nn.Module):
         return x
 
 
+def critic_ensemble(critics, state, edge_index, action):
+    """
+    Evaluates several GNNCritic instances (e.g. twin critics) in one batched pass.
+    The graph aggregation is linear, so it is done once for all critics; the critic weights are
+    stacked and applied with batched matmuls. Gradients flow back to every critic's own parameters.
+    Returns a (len(critics), B) tensor.
+    """
+    c0 = critics[0]
+    if c0.adjacency is not None:
+        agg = c0.adjacency.aggregate(state, edge_index)
+    else:
+        edge_index, edge_weight = gcn_norm(edge_index, None, state.size(0), add_self_loops=True, dtype=state.dtype)
+        agg = torch.zeros_like(state).index_add_(0, edge_index[1], state[edge_index[0]] * edge_weight.unsqueeze(-1))
+
+    K, N = len(critics), c0.act_dim
+
+    def stacked(name):
+        layer = [getattr(c, name) for c in critics]
+        weight = torch.stack([l.lin.weight if name == "conv1" else l.weight for l in layer])  # (K,out,in)
+        return weight.transpose(1, 2), torch.stack([l.bias for l in layer]).unsqueeze(1)  # (K,in,out), (K,1,out)
+
+    w, b = stacked("conv1")
+    out = F.relu(torch.baddbmm(b, agg.expand(K, -1, -1), w))  # (K,B*N,F)
+    x = out + state
+    action = action.reshape(1, -1, 1).expand(K, -1, -1)
+    x = torch.cat([x, action], dim=-1)  # (K,B*N,F+1)
+    for name in ("lin1", "lin2"):
+        w, b = stacked(name)
+        x = F.relu(torch.baddbmm(b, x, w), inplace=True)  # (K,B*N,H)
+    x = torch.sum(x.reshape(K, -1, N, x.size(-1)), dim=2)  # (K,B,H)
+    w, b = stacked("lin3")
+    return torch.baddbmm(b, x, w).squeeze(-1)  # (K,B)
+
+
 class GNNCriticLSTM(nn.Module):
     """
     Architecture 4: GNN, Concatenation, FC, Readout
@@ -90,9 +140,23 @@ class GNNVF(nn.Module):
         self.lin1 = nn.Linear(in_channels, hidden_size)
         self.lin2 = nn.Linear(hidden_size, hidden_size)
         self.lin3 = nn.Linear(hidden_size, 1)
+        self.adjacency = None
+
+    def set_topology(self, edge_index, dense=False):
+        """
+        Caches the GCN normalization of the fixed region graph, reused for every (batched) forward.
+        dense: graph convolution as a batched (N,N) matmul on (B,N,F) instead of message passing.
+        """
+        self.adjacency = CachedGCNAdjacency(edge_index, self.act_dim, dense=dense)
+        self.conv1.normalize = False
+
+    def conv(self, state, edge_index):
+        if self.adjacency is None:
+            return self.conv1(state, edge_index)
+        return self.adjacency(self.conv1, state, edge_index)
 
     def forward(self, state, edge_index):
-        out = F.relu(self.conv1(state, edge_index))
+        out = F.relu(self.conv(state, edge_index))
         x = out + state
         x = x.reshape(-1, self.act_dim, self.in_channels)
         x = torch.sum(x, dim=1)
@@ -0,0 +1,118 @@
+import torch
+from torch_geometric.nn.conv.gcn_conv import gcn_norm
+
+
+def gcn_adjacency(edge_index, num_nodes, dtype=torch.float32):
+    """
+    GCN-normalized adjacency of a graph as (edge_index, edge_weight): self-loops added and
+    symmetric degree normalization, exactly as GCNConv computes it on every call.
+    """
+    return gcn_norm(edge_index, None, num_nodes, add_self_loops=True, dtype=dtype)
+
+
+def dense_gcn_adjacency(edge_index, num_nodes, dtype=torch.float32):
+    """
+    GCN-normalized adjacency as a dense (N,N) matrix A, so that GCNConv's aggregation is A @ x.
+    """
+    edge_index, edge_weight = gcn_adjacency(edge_index, num_nodes, dtype)
+    adj = torch.zeros(num_nodes, num_nodes, dtype=dtype, device=edge_weight.device)
+    # messages flow from edge_index[0] (source) to edge_index[1] (target)
+    adj.index_put_((edge_index[1], edge_index[0]), edge_weight, accumulate=True)
+    return adj
+
+
+class CachedGCNAdjacency:
+    """
+    Normalized adjacency of a fixed graph (the region topology), computed once, and its
+    block-diagonal replicas for batches of graphs, cached per batch size.
+
+    GCNConv layers applied through __call__ skip their own normalization. With dense=True the
+    aggregation is a batched matmul of the (N,N) adjacency with the (B,N,F) node features instead of
+    message passing over the block-diagonal graph (faster for small graphs), using the conv's own
+    weights. Inputs whose edge_index is not B copies of the cached graph (compared edge by edge, a
+    different topology of the same size included) are normalized on the fly as before.
+    """
+
+    def __init__(self, edge_index, num_nodes, dense=False, max_cached=16):
+        self.num_nodes = num_nodes
+        self.num_edges = edge_index.size(1)
+        self.graph = edge_index.cpu()
+        self.graph_batches = {}
+        self.checked = None  # last edge_index found to match, skips the comparison when passed again
+        self.edge_index, self.edge_weight = gcn_adjacency(edge_index.cpu(), num_nodes)
+        self.dense = dense
+        self.max_cached = max_cached
+        self.batches = {}
+        self.dense_adj = {}
+
+    def batch(self, num_graphs, device, dtype=torch.float32):
+        """
+        (edge_index, edge_weight) of num_graphs copies of the graph, nodes numbered graph by graph.
+        """
+        key = (num_graphs, str(device), dtype)
+        if key not in self.batches:
+            if len(self.batches) >= self.max_cached:
+                self.batches.pop(next(iter(self.batches)))
+            offsets = torch.arange(num_graphs).view(1, -1, 1) * self.num_nodes
+            edge_index = (self.edge_index.unsqueeze(1) + offsets).reshape(2, -1)
+            edge_weight = self.edge_weight.repeat(num_graphs)
+            self.batches[key] = (edge_index.to(device), edge_weight.to(device, dtype))
+        return self.batches[key]
+
+    def adjacency(self, device, dtype=torch.float32):
+        """
+        Dense (N,N) normalized adjacency, aggregation is adjacency @ x.
+        """
+        key = (str(device), dtype)
+        if key not in self.dense_adj:
+            adj = torch.zeros(self.num_nodes, self.num_nodes, dtype=dtype)
+            adj.index_put_((self.edge_index[1], self.edge_index[0]), self.edge_weight.to(dtype), accumulate=True)
+            self.dense_adj[key] = adj.to(device)
+        return self.dense_adj[key]
+
+    def matches(self, edge_index, num_nodes):
+        # edge_index is a batch of copies of the cached graph
+        num_graphs = num_nodes // self.num_nodes
+        if num_nodes % self.num_nodes != 0 or edge_index.size(1) != num_graphs * self.num_edges:
+            return False
+        if edge_index is self.checked:
+            return True
+        key = (num_graphs, str(edge_index.device))
+        if key not in self.graph_batches:
+            if len(self.graph_batches) >= self.max_cached:
+                self.graph_batches.pop(next(iter(self.graph_batches)))
+            offsets = torch.arange(num_graphs).view(1, -1, 1) * self.num_nodes
+            self.graph_batches[key] = (self.graph.unsqueeze(1) + offsets).reshape(2, -1).to(edge_index.device)
+        if not torch.equal(edge_index, self.graph_batches[key].to(edge_index.dtype)):
+            return False
+        self.checked = edge_index
+        return True
+
+    def normalized(self, edge_index, num_nodes, dtype=torch.float32):
+        """
+        Normalized (edge_index, edge_weight) for a batch of num_nodes nodes.
+        """
+        if self.matches(edge_index, num_nodes):
+            return self.batch(num_nodes // self.num_nodes, edge_index.device, dtype)
+        return gcn_adjacency(edge_index, num_nodes, dtype)
+
+    def aggregate(self, x, edge_index):
+        """
+        Normalized neighbourhood aggregation of node features x (B*N,F), without weights.
+        """
+        if self.dense and self.matches(edge_index, x.size(0)):
+            h = x.view(-1, self.num_nodes, x.size(-1))
+            return torch.matmul(self.adjacency(x.device, x.dtype), h).view_as(x)
+        edge_index, edge_weight = self.normalized(edge_index, x.size(0), x.dtype)
+        return torch.zeros_like(x).index_add_(0, edge_index[1], x[edge_index[0]] * edge_weight.unsqueeze(-1))
+
+    def __call__(self, conv, x, edge_index):
+        """
+        Applies the GCNConv conv (with conv.normalize = False) to node features x.
+        """
+        if self.dense and self.matches(edge_index, x.size(0)):
+            h = conv.lin(x).view(-1, self.num_nodes, conv.out_channels)  # (B,N,F)
+            out = torch.matmul(self.adjacency(x.device, x.dtype), h).view(x.size(0), -1)
+            return out if conv.bias is None else out + conv.bias
+        edge_index, edge_weight = self.normalized(edge_index, x.size(0), x.dtype)
+        return conv(x, edge_index, edge_weight)
@@ -8,11 +8,13 @@ from src.algos.registry import get_model
 import os 
 
 def setup_sumo(cfg):
+    from src.envs.sim.sumo_backend import use_backend
     from src.envs.sim.sumo_env import Scenario, AMoD, GNNParser
     cfg.simulator.cplexpath = cfg.model.cplexpath
     if not cfg.simulator.directory:
         cfg.simulator.directory = f"{cfg.model.name}/{cfg.simulator.city}"
     cfg = cfg.simulator
+    print(f"SUMO backend: {use_backend(cfg.sumo_backend if hasattr(cfg, 'sumo_backend') else 'auto')}")
     scenario_path = 'src/envs/data'
     cfg.sumocfg_file = f'{scenario_path}/{cfg.city}/{cfg.sumocfg_file}'
     cfg.net_file = f'{scenario_path}/{cfg.city}/{cfg.net_file}'
@@ -246,6 +248,13 @@ def main(cfg: DictConfig):
    
     # Import simulator module based on the configuration
     simulator_name = cfg.simulator.name
+    if simulator_name == "sumo" and cfg.get('eval_workers', 1) > 1:
+        # one SUMO instance and policy copy per worker process
+        from src.misc.parallel_eval import evaluate_parallel
+        print(f'Testing on {cfg.eval_workers} SUMO instances...')
+        results = evaluate_parallel(cfg, cfg.model.test_episodes, cfg.eval_workers, cfg.get('eval_base_port'))
+        report(cfg, results)
+        return
     if simulator_name == "sumo":
         env, parser = setup_sumo(cfg)
 
@@ -259,8 +268,18 @@ def main(cfg: DictConfig):
 
     model = setup_model(cfg, env, parser, device)
     
+    recorder = None
+    if cfg.get('record_path'):
+        from src.misc.offline_dataset import TransitionRecorder
+        recorder = TransitionRecorder(f"data/{cfg.record_path}", parser)
+
     print('Testing...')
-    episode_reward, episode_served_demand, episode_rebalancing_cost, episode_inflows, episode_od_flows = model.test(cfg.model.test_episodes, env)
+    if recorder is not None:
+        results = model.test(cfg.model.test_episodes, env, recorder=recorder)
+    else:
+        results = model.test(cfg.model.test_episodes, env)
+    if recorder is not None:
+        recorder.close()
 
     # Congestion analysis (only for SUMO)
     try:
@@ -268,6 +287,22 @@ def main(cfg: DictConfig):
     except AttributeError:
         pass  # Method not available in macro environment
 
+    report(cfg, results)
+
+
+def report(cfg, results):
+    """
+    Prints the test results and saves the OD flows, compacts the recorded dataset.
+    """
+    # baselines do not return OD flows
+    episode_reward, episode_served_demand, episode_rebalancing_cost, episode_inflows = results[:4]
+    episode_od_flows = results[4] if len(results) > 4 else []
+
+    if cfg.get('record_path') and cfg.get('record_compact', True):
+        from src.misc.offline_dataset import compact_dataset
+        meta = compact_dataset(f"data/{cfg.record_path}")
+        print(f"Recorded dataset: data/{cfg.record_path} ({meta['num_samples']} samples)")
+
     print('Mean Episode Profit ($): ', np.mean(episode_reward), 'Std Episode Reward: ', np.std(episode_reward))
     print('Mean Episode Served Demand($): ', np.mean(episode_served_demand), 'Std Episode Served Demand: ', np.std(episode_served_demand))
     print('Mean Episode Rebalancing Cost($): ', np.mean(episode_rebalancing_cost), 'Std Episode Rebalancing Cost: ', np.std(episode_rebalancing_cost))
@@ -0,0 +1,110 @@
+"""
+Precomputed-graph paths of the GNNs (exported GNNActor inference, the cached GCN normalization and
+the dense graph convolution) against the plain GCNConv forward.
+"""
+import copy
+import pytest
+import torch
+from src.nets.actor import GNNActor, compile_actor
+from src.nets.critic import GNNCritic, GNNVF, critic_ensemble
+
+NODES, FEATURES, HIDDEN, BATCH = 6, 5, 32, 7
+EDGE_INDEX = torch.tensor([[0, 1, 2, 3, 4, 5, 0, 3], [1, 2, 3, 4, 5, 0, 3, 1]])
+# same number of edges, different topology
+OTHER_EDGE_INDEX = torch.tensor([[0, 0, 0, 0, 0, 1, 2, 4], [1, 2, 3, 4, 5, 3, 5, 2]])
+
+
+def make_actor(seed=0):
+    torch.manual_seed(seed)
+    return GNNActor(FEATURES, HIDDEN, act_dim=NODES)
+
+
+def batched(edge_index, batch=BATCH):
+    return torch.cat([edge_index + k * NODES for k in range(batch)], dim=1)
+
+
+def make_nets(seed=0):
+    torch.manual_seed(seed)
+    return [
+        GNNActor(FEATURES, HIDDEN, act_dim=NODES),
+        GNNCritic(FEATURES, HIDDEN, act_dim=NODES),
+        GNNCritic(FEATURES, HIDDEN, act_dim=NODES),
+        GNNVF(FEATURES, HIDDEN, act_dim=NODES),
+    ]
+
+
+def forward(nets, x, edge_index, action):
+    actor, critic1, critic2, vf = nets
+    with torch.no_grad():
+        return [
+            actor(x, edge_index, deterministic=True)[0],
+            actor(x, edge_index, return_dist=True).concentration,
+            critic1(x, edge_index, action),
+            critic_ensemble([critic1, critic2], x, edge_index, action),
+            vf(x, edge_index),
+        ]
+
+
+@pytest.mark.parametrize("backend", ["eager", "script", "compile"])
+@pytest.mark.parametrize("sparse", [False, True])
+def test_compiled_actor_matches_actor(backend, sparse):
+    actor = make_actor()
+    act = compile_actor(actor, EDGE_INDEX, backend=backend, sparse=sparse)
+    for seed in range(3):
+        x = torch.rand(NODES, FEATURES, generator=torch.Generator().manual_seed(seed))
+        with torch.no_grad():
+            expected = actor(x, EDGE_INDEX, deterministic=True)[0].squeeze(0).numpy()
+        assert act(x).shape == (NODES,)
+        assert act(x) == pytest.approx(expected, abs=1e-6)
+
+
+def test_compiled_actor_is_a_snapshot():
+    actor = make_actor()
+    x = torch.rand(NODES, FEATURES)
+    act = compile_actor(actor, EDGE_INDEX, backend="eager")
+    before = act(x)
+    with torch.no_grad():
+        actor.lin3.bias += 1.0
+    assert act(x) == pytest.approx(before)
+    with pytest.raises(ValueError):
+        compile_actor(actor, EDGE_INDEX, backend="onnx")
+
+
+@pytest.mark.parametrize("dense", [False, True])
+def test_cached_topology_matches_gcnconv(dense):
+    nets = make_nets()
+    cached = copy.deepcopy(nets)
+    for net in cached:
+        net.set_topology(EDGE_INDEX, dense=dense)
+    x = torch.rand(BATCH * NODES, FEATURES)
+    action = torch.rand(BATCH, NODES)
+    for edge_index in (EDGE_INDEX, batched(EDGE_INDEX), batched(EDGE_INDEX, 2)):
+        n = edge_index.max().item() // NODES + 1
+        for out, ref in zip(forward(cached, x[:n * NODES], edge_index, action[:n]), forward(nets, x[:n * NODES], edge_index, action[:n])):
+            torch.testing.assert_close(out, ref, atol=1e-6, rtol=1e-5)
+
+    # gradients are those of the plain layers
+    for nets_ in (nets, cached):
+        actor, critic1, critic2, vf = nets_
+        e = batched(EDGE_INDEX)
+        loss = actor(x, e, return_dist=True).concentration.sum() + critic_ensemble([critic1, critic2], x, e, action).sum() + vf(x, e).sum()
+        loss.backward()
+    for net, net_cached in zip(nets, cached):
+        for p, q in zip(net.parameters(), net_cached.parameters()):
+            torch.testing.assert_close(p.grad, q.grad, atol=1e-5, rtol=1e-5)
+
+
+@pytest.mark.parametrize("dense", [False, True])
+def test_other_topology_bypasses_cache(dense):
+    nets = make_nets()
+    cached = copy.deepcopy(nets)
+    for net in cached:
+        net.set_topology(EDGE_INDEX, dense=dense)
+    x = torch.rand(BATCH * NODES, FEATURES)
+    action = torch.rand(BATCH, NODES)
+    # the cached graph, a same-size different graph, then the cached graph again
+    for edge_index in (batched(EDGE_INDEX), batched(OTHER_EDGE_INDEX), batched(EDGE_INDEX)):
+        for out, ref in zip(forward(cached, x, edge_index, action), forward(nets, x, edge_index, action)):
+            torch.testing.assert_close(out, ref, atol=1e-6, rtol=1e-5)
+    # the different graph really changes the output
+    assert not torch.allclose(forward(cached, x, batched(OTHER_EDGE_INDEX), action)[2], forward(cached, x, batched(EDGE_INDEX), action)[2])
@@ -0,0 +1,54 @@
+"""
+greedy_matching must reach the objective of the matching LP (AMoD.matching_pulp).
+"""
+from collections import defaultdict
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from src.envs.sim.macro_env import AMoD, greedy_matching
+
+
+def lp_revenue(demand, price, supply, edges):
+    # matching_pulp only reads the time, acc, demand, price and edges of the environment
+    t = 0
+    env = SimpleNamespace(time=t, edges=edges, acc=defaultdict(dict), demand=defaultdict(dict), price=defaultdict(dict))
+    for n, s in enumerate(supply):
+        env.acc[n][t + 1] = s
+    for k, e in enumerate(edges):
+        env.demand[e][t] = demand[k]
+        env.price[e][t] = price[k]
+    flow = AMoD.matching_pulp(env)
+    assert flow is not None
+    return float(np.dot(price, flow))
+
+
+def instance(rng, regions, zero_supply=False, zero_demand=False, tied_prices=False):
+    edges = [(i, j) for i in range(regions) for j in range(regions)]
+    demand = rng.integers(0, 6, len(edges)).astype(float)
+    demand[rng.random(len(edges)) < 0.3] = 0.
+    price = rng.integers(1, 4, len(edges)).astype(float) if tied_prices else rng.uniform(1., 20., len(edges))
+    supply = rng.integers(0, 12, regions).astype(float)
+    if zero_supply:
+        supply[:] = 0.
+    if zero_demand:
+        demand[:] = 0.
+    return edges, demand, price, supply
+
+
+@pytest.mark.parametrize("case", [{}, {"zero_supply": True}, {"zero_demand": True}, {"tied_prices": True}])
+@pytest.mark.parametrize("seed", range(10))
+def test_greedy_matches_lp_objective(case, seed):
+    rng = np.random.default_rng(seed)
+    edges, demand, price, supply = instance(rng, regions=int(rng.integers(2, 7)), **case)
+    src = np.array([i for i, _ in edges])
+    flow = greedy_matching(demand, price, supply, src)
+
+    # feasible: within demand and within the vehicles of each origin
+    assert np.all(flow >= 0) and np.all(flow <= demand + 1e-9)
+    assert np.all(np.bincount(src, weights=flow, minlength=len(supply)) <= supply + 1e-9)
+    assert np.dot(price, flow) == pytest.approx(lp_revenue(demand, price, supply, edges), abs=1e-6)
+
+
+def test_greedy_serves_highest_prices_first():
+    flow = greedy_matching(np.array([2., 2., 2.]), np.array([1., 5., 3.]), np.array([3.]), np.zeros(3, dtype=int))
+    np.testing.assert_allclose(flow, [0., 2., 1.])
@@ -0,0 +1,81 @@
+"""
+TransitionRecorder -> compact_dataset -> memory-mapped ReplayData.
+"""
+import threading
+from types import SimpleNamespace
+import numpy as np
+import torch
+from torch_geometric.data import Data
+from src.algos.sac import ReplayData
+from src.misc.offline_dataset import TransitionRecorder, compact_dataset, load_dataset
+
+NODES, FEATURES = 4, 3
+EDGE_INDEX = torch.tensor([[0, 1, 2, 3], [1, 2, 3, 0]])
+
+
+class Parser:
+    # parses the last element of the observation, like the SUMO GNNParser reads obs[4]
+    def parse_obs(self, obs):
+        return Data(torch.full((NODES, FEATURES), float(obs[-1])), EDGE_INDEX)
+
+
+def record_episode(recorder, steps, start, sumo_obs=False):
+    env = SimpleNamespace()
+    for t in range(steps):
+        # SUMO observations have a fifth entry (unserved demand)
+        env.obs = (None, t, None, None, start + t) if sumo_obs else (None, t, None, start + t)
+        recorder.decision(env, np.full(NODES, 1 / NODES), reward=float(start + t))
+    env.obs = env.obs[:-1] + (start + steps,)
+    recorder.end_episode(env, reward=float(start + steps))
+
+
+def test_record_compact_and_sample(tmp_path):
+    path = str(tmp_path / "dataset")
+    a = TransitionRecorder(path, Parser(), chunk_size=3)
+    b = TransitionRecorder(path, Parser(), chunk_size=3)
+    record_episode(a, 5, start=0)
+    record_episode(b, 4, start=100, sumo_obs=True)
+    a.close()
+    assert compact_dataset(path)["num_samples"] == 5 + 3  # b's buffered transition is not flushed yet
+
+    # b keeps recording after a's compaction removed the merged chunks
+    record_episode(b, 3, start=200, sumo_obs=True)
+    b.close()
+    meta = compact_dataset(path)
+    assert meta["num_samples"] == 5 + 4 + 3
+    assert (meta["nodes"], meta["features"], meta["action_dim"]) == (NODES, FEATURES, NODES)
+    assert meta["edge_index"] == EDGE_INDEX.tolist()
+
+    arrays, _ = load_dataset(path)
+    # next_state of a transition is the state of the following decision
+    np.testing.assert_allclose(arrays["next_state"][:, 0, 0], arrays["state"][:, 0, 0] + 1)
+    np.testing.assert_allclose(sorted(arrays["reward"]), sorted([1, 2, 3, 4, 5, 101, 102, 103, 104, 201, 202, 203]))
+
+    buffer = ReplayData(device="cpu")
+    buffer.load_memmap(path, edge_index=None, rew_scale=0.5)
+    assert buffer.size() == 12
+    batches = buffer.sample_batches(3, batch_size=4)
+    assert len(batches) == 3
+    for batch in batches:
+        assert batch.x_s.shape == (4 * NODES, FEATURES) and batch.x_t.shape == (4 * NODES, FEATURES)
+        assert batch.action.shape == (4 * NODES,) and batch.reward.shape == (4,)
+        assert batch.edge_index_s.shape == (2, 4 * EDGE_INDEX.size(1))
+        # rewards are scaled when sampling, states follow their rewards
+        np.testing.assert_allclose(2 * batch.reward, batch.x_s.view(4, NODES, FEATURES)[:, 0, 0] + 1)
+
+
+def test_concurrent_compaction(tmp_path):
+    path = str(tmp_path / "dataset")
+    recorders = [TransitionRecorder(path, Parser(), chunk_size=2) for _ in range(4)]
+    for k, recorder in enumerate(recorders):
+        record_episode(recorder, 6, start=100 * k)
+        recorder.close()
+    threads = [threading.Thread(target=compact_dataset, args=(path,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    arrays, meta = load_dataset(path)
+    # every chunk is merged exactly once
+    assert meta["num_samples"] == 4 * 6
+    assert len(set(np.asarray(arrays["reward"]).tolist())) == 4 * 6
@@ -0,0 +1,146 @@
+"""
+The in-process rebalancing solvers must reach the objective of the PuLP reference
+(solveRebFlow_pulp, the soft-constraint model of minRebDistRebOnly.mod) with feasible flows.
+"""
+from collections import defaultdict
+from types import SimpleNamespace
+import networkx as nx
+import numpy as np
+import pytest
+from src.algos.reb_flow_solver import (
+    RebFlowSolver, solveRebFlow_pulp, solveRebFlow_highs, solveRebFlow_network, solveRebFlow_batch,
+)
+
+PENALTIES = [0.0, 3.0, 50.0]
+
+
+def make_env(seed, regions=6, penalty=3.0):
+    """
+    Random instance on a symmetric region graph (a ring plus random chords), laid out like AMoD:
+    env.edges holds every graph edge and one self-loop per region.
+    """
+    rng = np.random.default_rng(seed)
+    G = nx.DiGraph()
+    G.add_nodes_from(range(regions))
+    pairs = {(k, (k + 1) % regions) for k in range(regions)}
+    pairs |= {tuple(rng.choice(regions, 2, replace=False)) for _ in range(regions)}
+    for i, j in pairs:
+        time = int(rng.integers(1, 8))
+        G.add_edge(i, j, time=time)
+        G.add_edge(j, i, time=time)
+    acc = defaultdict(dict)
+    for n in range(regions):
+        acc[n][1] = int(rng.integers(0, 15))
+    edges = [(n, n) for n in range(regions)] + list(G.edges)
+    env = SimpleNamespace(time=0, region=list(range(regions)), G=G, edges=edges, acc=acc,
+                          cfg=SimpleNamespace(shortage_penalty=penalty))
+    total = sum(acc[n][1] for n in env.region)
+    share = rng.dirichlet(np.ones(regions))
+    desired = {n: int(share[n] * total) for n in env.region}
+    return env, desired
+
+
+def check_feasible(env, desired, action, shortage):
+    action = np.asarray(action, dtype=float)
+    assert np.all(action >= -1e-9)
+    np.testing.assert_allclose(action, np.round(action))  # network matrix: integral flows
+    for k in env.region:
+        out = sum(a for (i, j), a in zip(env.edges, action) if i == k and j != k)
+        inflow = sum(a for (i, j), a in zip(env.edges, action) if j == k and i != k)
+        assert out <= env.acc[k][1] + 1e-9
+        # the shortage covers what the flows leave of the target
+        assert shortage[k] >= desired[k] - (env.acc[k][1] + inflow - out) - 1e-6
+        assert shortage[k] >= -1e-9
+
+
+def objective(env, action, shortage):
+    cost = sum(a * env.G.edges[i, j]['time'] for (i, j), a in zip(env.edges, action) if i != j)
+    return cost + env.cfg.shortage_penalty * sum(shortage[k] for k in env.region)
+
+
+@pytest.mark.parametrize("penalty", PENALTIES)
+@pytest.mark.parametrize("seed", range(8))
+def test_highs_matches_pulp(seed, penalty):
+    env, desired = make_env(seed, penalty=penalty)
+    _, ref = solveRebFlow_pulp(env, desired, return_info=True)
+    action, info = solveRebFlow_highs(env, desired, return_info=True)
+    check_feasible(env, desired, action, info['shortage'])
+    assert info['objective'] == pytest.approx(ref['objective'], abs=1e-6)
+    assert objective(env, action, info['shortage']) == pytest.approx(info['objective'], abs=1e-6)
+
+
+def test_highs_warm_start_sequence():
+    # one persistent solver re-solved with new vehicles, targets and travel times every step
+    env, desired = make_env(0)
+    rng = np.random.default_rng(1)
+    solver = None
+    for step in range(10):
+        for n in env.region:
+            env.acc[n][1] = int(rng.integers(0, 15))
+        for i, j in env.G.edges:
+            env.G.edges[i, j]['time'] = int(rng.integers(1, 8))
+        desired = {n: int(rng.integers(0, 15)) for n in env.region}
+        _, ref = solveRebFlow_pulp(env, desired, return_info=True)
+        action, info = solveRebFlow_highs(env, desired, return_info=True)
+        check_feasible(env, desired, action, info['shortage'])
+        assert info['objective'] == pytest.approx(ref['objective'], abs=1e-6), step
+        assert solver is None or env.reb_flow_solver is solver  # built once, then only updated
+        solver = env.reb_flow_solver
+
+
+def test_linprog_fallback_matches_pulp():
+    # without highspy the cached matrix is solved with scipy's linprog
+    env, desired = make_env(3)
+    solver = RebFlowSolver(env)
+    solver.highs = None
+    env.reb_flow_solver = solver
+    _, ref = solveRebFlow_pulp(env, desired, return_info=True)
+    action, info = solveRebFlow_highs(env, desired, return_info=True)
+    check_feasible(env, desired, action, info['shortage'])
+    assert info['objective'] == pytest.approx(ref['objective'], abs=1e-6)
+
+
+def test_penalty_trades_shortage_against_travel():
+    shortages = []
+    for penalty in (0.0, 3.0, 1e3):
+        env, desired = make_env(5, penalty=penalty)
+        action, info = solveRebFlow_highs(env, desired, return_info=True)
+        if penalty == 0:
+            assert sum(action) == 0 and info['objective'] == 0  # a free shortage never pays for a trip
+        shortages.append(sum(info['shortage'].values()))
+    # a higher penalty never leaves more of the targets uncovered
+    assert shortages[0] >= shortages[1] >= shortages[2]
+    assert shortages[0] > shortages[2]
+
+
+@pytest.mark.parametrize("penalty", PENALTIES)
+@pytest.mark.parametrize("seed", range(8))
+def test_network_matches_pulp(seed, penalty):
+    env, desired = make_env(seed, penalty=penalty)
+    _, ref = solveRebFlow_pulp(env, desired, return_info=True)
+    action, info = solveRebFlow_network(env, desired, return_info=True)
+    check_feasible(env, desired, action, info['shortage'])
+    assert info['objective'] == pytest.approx(ref['objective'], abs=1e-6)
+    assert objective(env, action, info['shortage']) == pytest.approx(info['objective'], abs=1e-6)
+
+
+@pytest.mark.parametrize("penalty", PENALTIES)
+def test_batch_matches_pulp(penalty):
+    # instances share the topology, vehicles, targets and travel times differ
+    env, _ = make_env(0, penalty=penalty)
+    rng = np.random.default_rng(2)
+    batch = 5
+    acc = rng.integers(0, 15, (batch, len(env.region)))
+    desired = rng.integers(0, 15, (batch, len(env.region)))
+    time = rng.integers(1, 8, (batch, len(env.G.edges)))
+    actions, info = solveRebFlow_batch(env, acc, desired, time=time, return_info=True)
+    assert actions.shape == (batch, len(env.edges))
+    for b in range(batch):
+        for n in env.region:
+            env.acc[n][1] = int(acc[b, n])
+        for (i, j), t in zip(env.G.edges, time[b]):
+            env.G.edges[i, j]['time'] = int(t)
+        target = {n: int(desired[b, n]) for n in env.region}
+        _, ref = solveRebFlow_pulp(env, target, return_info=True)
+        check_feasible(env, target, actions[b], dict(zip(env.region, info['shortage'][b])))
+        assert info['objective'][b] == pytest.approx(ref['objective'], abs=1e-6)
@@ -0,0 +1,110 @@
+"""
+ReplayData: the tensor ring buffer and sampling from memory-mapped offline datasets.
+"""
+import os
+import pickle
+import numpy as np
+import torch
+from torch_geometric.data import Batch, Data
+from src.algos.sac import PairData, ReplayData
+from src.misc.offline_dataset import convert_pickle, write_dataset
+
+NODES, FEATURES = 4, 3
+EDGE_INDEX = torch.tensor([[0, 1, 2, 3, 0], [1, 2, 3, 0, 2]])
+
+
+def transition(i):
+    # every field encodes the transition index i
+    state = Data(torch.full((NODES, FEATURES), float(i)), EDGE_INDEX)
+    next_state = Data(torch.full((NODES, FEATURES), i + 0.5), EDGE_INDEX)
+    return state, torch.full((NODES,), float(i)), float(i), next_state
+
+
+def check_batch(batch, batch_size, rew_scale=1.0):
+    assert batch.x_s.shape == (batch_size * NODES, FEATURES) and batch.x_t.shape == (batch_size * NODES, FEATURES)
+    assert batch.action.shape == (batch_size * NODES,) and batch.reward.shape == (batch_size,)
+    ids = batch.x_s[::NODES, 0]
+    assert len(set(ids.tolist())) == batch_size  # no repeats within a batch
+    # the fields of every sample belong to the same transition
+    torch.testing.assert_close(batch.x_t.view(batch_size, NODES, FEATURES), (ids + 0.5).view(-1, 1, 1).expand(-1, NODES, FEATURES))
+    torch.testing.assert_close(batch.action.view(batch_size, NODES), ids.view(-1, 1).expand(-1, NODES))
+    torch.testing.assert_close(batch.reward, rew_scale * ids)
+    # same layout as Batch.from_data_list(<PairData list>, follow_batch=['x_s', 'x_t'])
+    reference = Batch.from_data_list(
+        [PairData(EDGE_INDEX, batch.x_s[k * NODES:(k + 1) * NODES], None, None, EDGE_INDEX, batch.x_t[k * NODES:(k + 1) * NODES])
+         for k in range(batch_size)],
+        follow_batch=["x_s", "x_t"],
+    )
+    assert torch.equal(batch.edge_index_s, reference.edge_index_s) and torch.equal(batch.edge_index_t, reference.edge_index_t)
+    assert torch.equal(batch.x_s_batch, reference.x_s_batch) and torch.equal(batch.x_t_batch, reference.x_t_batch)
+    return ids
+
+
+def test_ring_buffer_wraps_around():
+    buffer = ReplayData(device="cpu", capacity=5)
+    for i in range(3):
+        buffer.store(*transition(i))
+    assert (buffer.size(), buffer.ptr) == (3, 3)
+    for i in range(3, 8):
+        buffer.store(*transition(i))
+    assert (buffer.size(), buffer.ptr) == (5, 3)
+    # the three oldest transitions were overwritten in place
+    assert buffer.x_s[:, 0, 0].tolist() == [5, 6, 7, 3, 4]
+    assert buffer.reward.tolist() == [5, 6, 7, 3, 4]
+
+    seen = set()
+    for _ in range(20):
+        ids = check_batch(buffer.sample_batch(4), 4)
+        seen.update(ids.tolist())
+    assert seen == {3, 4, 5, 6, 7}
+
+
+def test_sample_batches():
+    buffer = ReplayData(device="cpu", capacity=50)
+    for i in range(30):
+        buffer.store(*transition(i))
+    batches = buffer.sample_batches(3, batch_size=8)
+    assert len(batches) == 3
+    for batch in batches:
+        check_batch(batch, 8)
+    # list actions (as stored by the training loops) are accepted
+    state, action, reward, next_state = transition(30)
+    buffer.store(state, action.tolist(), reward, next_state)
+    assert buffer.action[30].tolist() == [30.0] * NODES
+
+
+def test_memmap_dataset_samples_like_pickle(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    transitions = [transition(i) for i in range(20)]
+    data = {
+        "state": [t[0].x for t in transitions],
+        "action": [t[1] for t in transitions],
+        "reward": np.array([t[2] for t in transitions]),
+        "next_state": [t[3].x for t in transitions],
+    }
+    with open("data/offline.pkl", "wb") as f:
+        pickle.dump(data, f)
+    convert_pickle("data/offline.pkl", "data/offline_memmap", edge_index=EDGE_INDEX)
+
+    # the same transitions, from the pickle (in memory) and from the memory-mapped directory
+    in_memory = ReplayData(device="cpu", capacity=5)
+    in_memory.create_dataset(EDGE_INDEX, "offline", rew_scale=0.1)
+    memmap = ReplayData(device="cpu")
+    memmap.create_dataset(None, "offline_memmap", rew_scale=0.1)
+    assert not in_memory.memmap and memmap.memmap
+    assert in_memory.size() == memmap.size() == 20
+    assert torch.equal(memmap.edge_index, EDGE_INDEX)
+
+    for buffer in (in_memory, memmap):
+        seen = set()
+        for batch in buffer.sample_batches(10, batch_size=6):
+            seen.update(check_batch(batch, 6, rew_scale=0.1).tolist())
+        assert seen <= set(range(20))
+
+    # size limits the samples read from the dataset
+    write_dataset("data/small", data["state"], data["action"], data["reward"], data["next_state"])
+    small = ReplayData(device="cpu")
+    small.load_memmap("data/small", EDGE_INDEX, rew_scale=1.0, size=7)
+    assert small.size() == 7
+    assert set(check_batch(small.sample_batch(7), 7).tolist()) == set(range(7))
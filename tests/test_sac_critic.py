@@ -0,0 +1,126 @@
+"""
+The fused twin-critic paths of SAC (critic_ensemble, the single-backward update with a _foreach
+Polyak average, the vectorized CQL sampling) against their per-critic / per-state equivalents.
+"""
+import copy
+from types import SimpleNamespace
+import pytest
+import torch
+from torch import nn
+from torch_geometric.data import Data
+from src.algos.sac import SAC
+from src.nets.critic import GNNCritic, critic_ensemble
+
+NODES, FEATURES, HIDDEN = 5, 4, 16
+EDGE_INDEX = torch.tensor([[0, 1, 2, 3, 4, 0, 2], [1, 2, 3, 4, 0, 2, 4]])
+
+
+def make_sac(seed=0, fused_critic=True):
+    torch.manual_seed(seed)
+    cfg = SimpleNamespace(
+        hidden_size=HIDDEN, alpha=0.3, batch_size=8, p_lr=1e-3, q_lr=1e-3, auto_entropy=False, clip=500,
+        use_LSTM=False, cplexpath=None, directory=None, agent_name="test", fused_critic=fused_critic,
+        min_q_weight=5.0, temp=1.0, num_random=3,
+    )
+    sac = SAC(SimpleNamespace(nregion=NODES), FEATURES, cfg, SimpleNamespace(edge_index=EDGE_INDEX))
+    sac.wandb = None
+    return sac
+
+
+def make_batch(sac, batch_size=8, seed=1):
+    g = torch.Generator().manual_seed(seed)
+    for _ in range(batch_size):
+        sac.replay_buffer.store(
+            Data(torch.rand(NODES, FEATURES, generator=g), EDGE_INDEX),
+            torch.distributions.Dirichlet(torch.ones(NODES)).sample(),
+            torch.rand(1, generator=g).item(),
+            Data(torch.rand(NODES, FEATURES, generator=g), EDGE_INDEX),
+        )
+    return sac.replay_buffer.sample_batch(batch_size)
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_critic_ensemble_matches_separate_critics(cached):
+    torch.manual_seed(0)
+    critics = [GNNCritic(FEATURES, HIDDEN, act_dim=NODES) for _ in range(2)]
+    if cached:
+        for critic in critics:
+            critic.set_topology(EDGE_INDEX)
+    batch = 6
+    state = torch.rand(batch * NODES, FEATURES)
+    edge_index = torch.cat([EDGE_INDEX + k * NODES for k in range(batch)], dim=1)
+    action = torch.rand(batch, NODES)
+
+    fused = critic_ensemble(critics, state, edge_index, action)
+    assert fused.shape == (2, batch)
+    for k, critic in enumerate(critics):
+        torch.testing.assert_close(fused[k], critic(state, edge_index, action), atol=5e-7, rtol=1e-6)
+
+    # gradients reach each critic's own parameters
+    fused.sum().backward()
+    grads = [[p.grad.clone() for p in c.parameters()] for c in critics]
+    for c in critics:
+        c.zero_grad()
+    sum(c(state, edge_index, action).sum() for c in critics).backward()
+    for c, grad in zip(critics, grads):
+        for p, g in zip(c.parameters(), grad):
+            torch.testing.assert_close(g, p.grad, atol=1e-5, rtol=1e-5)
+
+
+def test_fused_update_matches_separate_critics():
+    fused, plain = make_sac(fused_critic=True), make_sac(fused_critic=False)
+    data = make_batch(fused)
+    target_before = [p.clone() for p in fused.critic_target_params]
+    for sac in (fused, plain):
+        torch.manual_seed(2)  # same target actions from the (identical) actors
+        sac.update(data, only_q=True)
+
+    for p, q in zip(fused.critic_params, plain.critic_params):
+        torch.testing.assert_close(p, q, atol=1e-5, rtol=1e-5)
+    for p, q in zip(fused.critic_target_params, plain.critic_target_params):
+        torch.testing.assert_close(p, q, atol=1e-5, rtol=1e-5)
+    # the _foreach Polyak average, parameter by parameter
+    for target, old, p in zip(fused.critic_target_params, target_before, fused.critic_params):
+        torch.testing.assert_close(target, fused.polyak * old + (1 - fused.polyak) * p)
+
+
+class MeanActor(nn.Module):
+    # the actor's Dirichlet mean and its log-density: a deterministic function of each state
+    def __init__(self, actor):
+        super().__init__()
+        self.actor = actor
+
+    def forward(self, state, edge_index, deterministic=False):
+        m = self.actor(state, edge_index, return_dist=True)
+        return m.mean, m.log_prob(m.mean)
+
+
+def test_cql_sampling_matches_per_state_loop():
+    sac = make_sac()
+    sac.actor = MeanActor(sac.actor)
+    batch_size, num_actions = 4, sac.num_random
+    data = make_batch(sac, batch_size)
+
+    torch.manual_seed(3)
+    values = sac._get_action_and_values(data, num_actions, batch_size, NODES)
+    torch.manual_seed(3)
+    random_actions = torch.distributions.Dirichlet(torch.ones(NODES)).sample((batch_size * num_actions,))
+
+    x_s = data.x_s.view(batch_size, NODES, FEATURES)
+    x_t = data.x_t.view(batch_size, NODES, FEATURES)
+    for b in range(batch_size):
+        with torch.no_grad():
+            current, current_log = sac.actor(x_s[b], EDGE_INDEX)
+            next_, next_log = sac.actor(x_t[b], EDGE_INDEX)
+            # row b holds the num_actions samples of state b
+            expected = [current_log.expand(num_actions), next_log.expand(num_actions)]
+            for critic in (sac.critic1, sac.critic2):
+                expected.append(torch.cat([
+                    critic(x_s[b], EDGE_INDEX, random_actions[b * num_actions + k].unsqueeze(0))
+                    for k in range(num_actions)
+                ]))
+            for actions in (current, next_):
+                for critic in (sac.critic1, sac.critic2):
+                    expected.append(critic(x_s[b], EDGE_INDEX, actions).expand(num_actions))
+        for value, reference in zip(values[1:], expected):
+            torch.testing.assert_close(value[b].squeeze(-1), reference, atol=1e-5, rtol=1e-5)
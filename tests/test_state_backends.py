@@ -0,0 +1,53 @@
+"""
+The dict and array state backends of the macro AMoD must give the same transitions.
+"""
+import json
+import os
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from src.envs.sim.macro_env import Scenario, AMoD
+from src.misc.utils import dictsum
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "envs", "data", "macro")
+
+
+def make_env(backend, city="nyc_brooklyn"):
+    with open(os.path.join(DATA, "calibrated_parameters.json")) as f:
+        params = json.load(f)[city]
+    cfg = SimpleNamespace(cplexpath="None", directory="", state_backend=backend, time_horizon=6)
+    scenario = Scenario(json_file=os.path.join(DATA, f"scenario_{city}.json"), demand_ratio=params["demand_ratio"],
+                        json_hr=params["json_hr"], sd=10, json_tstep=3, tf=20)
+    return AMoD(scenario, cfg=cfg, beta=params["beta"])
+
+
+def rollout(backend, seed=0):
+    env = make_env(backend)
+    np.random.seed(seed)
+    env.reset()
+    rng = np.random.RandomState(1)
+    out = []
+    done = False
+    while not done:
+        total = dictsum(env.acc, env.time + 1)
+        # external passenger actions on every edge, also where nobody is waiting
+        pax = [rng.rand() * total / 10 for _ in env.edges]
+        t = env.time
+        _, pax_reward, _, info = env.pax_step(paxAction=pax)
+        for i, j in env.edges:
+            if env.demand[i, j].get(t, 0) <= 0:
+                assert env.servedDemand[i, j].get(t, 0) == 0, f"served ({i},{j}) at {t} without demand"
+        out.append((pax_reward, info["served_demand"], info["revenue"]))
+        reb = [rng.rand() * total / 5 if (i, j) in env.G.edges else 0 for i, j in env.edges]
+        _, reb_reward, done, _ = env.reb_step(reb)
+        out.append((reb_reward, [env.acc[n][env.time] for n in env.region]))
+    return out
+
+
+def test_external_pax_actions_agree():
+    if not os.path.exists(os.path.join(DATA, "scenario_nyc_brooklyn.json")):
+        pytest.skip("macro scenario data not available")
+    dict_out, array_out = rollout("dict"), rollout("array")
+    assert len(dict_out) == len(array_out)
+    for a, b in zip(dict_out, array_out):
+        np.testing.assert_allclose(np.hstack(a), np.hstack(b))
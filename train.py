@@ -9,11 +9,13 @@ from omegaconf import OmegaConf
 
 
 def setup_sumo(cfg):
+    from src.envs.sim.sumo_backend import use_backend
     from src.envs.sim.sumo_env import Scenario, AMoD, GNNParser
     cfg.simulator.cplexpath = cfg.model.cplexpath
     if not cfg.simulator.directory:
         cfg.simulator.directory = f"{cfg.model.name}/{cfg.simulator.city}"
     cfg = cfg.simulator
+    print(f"SUMO backend: {use_backend(cfg.sumo_backend if hasattr(cfg, 'sumo_backend') else 'auto')}")
     scenario_path = 'src/envs/data'
     cfg.sumocfg_file = f'{scenario_path}/{cfg.city}/{cfg.sumocfg_file}'
     cfg.net_file = f'{scenario_path}/{cfg.city}/{cfg.net_file}'
@@ -52,6 +54,28 @@ def setup_macro(cfg):
     parser = GNNParser(env, T=cfg.time_horizon, json_file=f"src/envs/data/macro/scenario_{city}.json")
     return env, parser
 
+def setup_vector_macro(cfg):
+    from src.envs.sim.macro_env import Scenario
+    from src.envs.sim.vector_env import VectorAMoD
+    with open("src/envs/data/macro/calibrated_parameters.json", "r") as file:
+        calibrated_params = json.load(file)
+
+    num_envs = cfg.model.num_envs
+    cfg = cfg.simulator
+    city = cfg.city
+
+    scenario = Scenario(
+    json_file=f"src/envs/data/macro/scenario_{city}.json",
+    demand_ratio=calibrated_params[city]["demand_ratio"],
+    json_hr=calibrated_params[city]["json_hr"],
+    sd=cfg.seed,
+    json_tstep=cfg.json_tsetp,
+    tf=cfg.max_steps,
+    )
+    venv = VectorAMoD(scenario, cfg=cfg, beta=calibrated_params[city]["beta"], num_envs=num_envs,
+                      T=cfg.time_horizon, json_file=f"src/envs/data/macro/scenario_{city}.json")
+    return venv
+
 def setup_model(cfg, env, parser, device):
     model_name = cfg.model.name
     cfg = cfg.model
@@ -152,6 +176,12 @@ def load_actor_weights(model, path):
 
 @hydra.main(version_base=None, config_path="src/config/", config_name="config")
 def main(cfg: DictConfig):
+    if cfg.model.no_cuda or not torch.cuda.is_available():
+        # thread pools and core pinning before any parallel work (separate cores for the LP solvers)
+        from src.misc.cpu_perf import configure_cpu
+        configure_cpu(cfg.model.get("cpu_threads"), cfg.model.get("cpu_interop_threads"),
+                      cfg.model.get("torch_cores"), cfg.model.get("solver_cores"))
+
     # Import simulator module based on the configuration
     simulator_name = cfg.simulator.name
     if simulator_name == "sumo":
@@ -203,6 +233,11 @@ def main(cfg: DictConfig):
     if hasattr(cfg.model, "data_path"): 
         Dataset = setup_dataset(cfg, env, device)
         model.learn(cfg, Dataset) #offline RL or BC
+    elif cfg.model.get("num_workers", 0) > 0:
+        model.learn_async(cfg) #online RL, asynchronous rollout workers
+    elif simulator_name == "macro" and cfg.model.get("num_envs", 1) > 1:
+        venv = setup_vector_macro(cfg)
+        model.learn_vector(cfg, venv) #online RL, parallel environments
     else:
         model.learn(cfg) #online RL
 